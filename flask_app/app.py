@@ -1,33 +1,118 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-import os
+# Imported first so startup timings include everything below
+from provider import startup
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before the modules that read their settings
+# from it at import
 load_dotenv()
 
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from google.cloud import firestore
+import json
+import os
+import threading
+import click
+from datetime import datetime
+from models import Product, Order
+from provider.product_provider import ProductProvider
+from provider.pagination import check_cursor, fetch_page, CursorMismatchError, PAGE_SIZE
+from provider.documents import get_document, get_many, get_many_by_collection
+from provider.datastore import create_client, create_auth, rpc_deadline
+from provider.fanout import FanOut
+from provider import documents, images, metrics, tasks, tracing
+from provider.user_roles import (cached_identity, resolve_user, remember_identity,
+                                 forget_identity, revoke_sessions, session_issued_at, set_user_role)
+from provider.admin_stats import dashboard_totals, fetch_users_page, USER_COLLECTIONS
+from controllers.vendor_order_controller import (get_vendor_stats, recent_orders,
+                                                 record_order_created, record_status_change,
+                                                 rebuild_vendor_stats)
+from controllers.customer_order_controller import (place_order as create_order,
+                                                   OrderError, OutOfStockError)
+from controllers.review_controller import (reviews_page, submit_review, rebuild_review_stats,
+                                           ReviewError)
+from provider.storefront import Storefront
+from provider.category_counts import rebuild_category_counts
+from provider.search_index import SearchIndex
+from provider.related_index import RelatedIndex, RELATED_LIMIT
+from provider.object_store import create_store
+from provider.images import ImagePipeline, ImageError
+from provider.http_cache import Representation
+from provider.page_cache import PageCache
+from provider.catalog_mirror import CatalogMirror, price_bounds, rating_bound
+from provider.ttl_cache import TTLCache
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
-# Initialize Firebase Admin
-cred = credentials.Certificate({
-    "type": "service_account",
-    "project_id": "daddy-ecom-store",
-    "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-    "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
-    "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-    "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-    "token_uri": "https://oauth2.googleapis.com/token",
-    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-    "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
-})
-
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Database and auth clients for the configured backend (DATA_BACKEND). Both
+# are created on first use, in the process that uses them, so importing this
+# module needs no credentials and opens no connections.
+db = create_client()
+auth = create_auth()
+
+# Per-route Firestore read/write accounting and latency histograms
+metrics.instrument_firestore(db)
+metrics.init_app(app)
+documents.init_app(app)
+startup.init_app(app)
+
+# Post-request writes (role backfills, rollup rebuilds) run on a bounded
+# background queue, spooled to disk until they finish
+tasks.init_app(app, db)
+
+# Sampled request traces: Firestore calls, template renders and auth calls
+tracing.init_app(app)
+tracing.instrument_functions(auth, ['get_user_by_email', 'create_user', 'update_user'], 'auth')
+
+# In-process catalog cache, kept live by Firestore listeners
+product_provider = ProductProvider(db)
+search_index = SearchIndex()
+product_provider.add_listener(search_index.on_product_change)
+related_index = RelatedIndex()
+product_provider.add_listener(related_index.on_product_change)
+catalog_mirror = CatalogMirror(product_provider)
+product_provider.add_listener(catalog_mirror.on_product_change)
+product_provider.add_category_listener(catalog_mirror.on_category_change)
+storefront = Storefront(db, product_provider, lambda: product_listing())
+product_provider.add_listener(storefront.on_product_change)
+product_provider.add_category_listener(storefront.on_category_change)
+
+# Uploaded images: resized WebP/JPEG variants in the media store, with
+# image_src/srcset template filters to pick between them
+media_store = create_store()
+image_pipeline = ImagePipeline(media_store)
+images.init_app(app)
+# Request bodies are refused before they are read past the image size limit
+# (plus room for the rest of the form)
+app.config['MAX_CONTENT_LENGTH'] = images.MAX_UPLOAD_BYTES + 64 * 1024
+
+def catalog_version():
+    # Changes with every product or category write while the catalog listener
+    # runs; None when it does not, as then nothing reports changes
+    return product_provider.version if product_provider.available else None
+
+def page_version():
+    # Pages also show the storefront, which is rebuilt a little after the
+    # catalog changes
+    version = catalog_version()
+    return None if version is None else (version, storefront.version)
+
+# Anonymous storefront pages served from rendered, compressed HTML while
+# the catalog is unchanged
+page_cache = PageCache(app, page_version)
+
+# JSON catalog API (/api/v1): encoded replies kept per catalog version, so
+# repeat requests for an unchanged catalog cost no reads
+api_responses = TTLCache(maxsize=int(os.getenv('API_CACHE_SIZE', 512)), ttl=int(os.getenv('API_CACHE_TTL', 300)))
+API_PAGE_SIZE_MAX = 100
+PRODUCT_API_FIELDS = list(Product(None).to_dict())
+PRODUCT_API_DEFAULT_FIELDS = ['productId'] + Product.LISTING_FIELDS
+
+# Products listed on the vendor dashboard
+VENDOR_PRODUCTS_LIMIT = 20
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -42,79 +127,30 @@ class User(UserMixin):
         self.role = role
 
 @login_manager.user_loader
+@tracing.traced('auth.load_user', 'auth')
 def load_user(user_id):
     try:
-        user = auth.get_user(user_id)
-        # Get user role from Firestore
-        user_doc = db.collection('buyers').document(user_id).get()
-        if user_doc.exists:
-            return User(user_id, user.email, 'buyer')
-        user_doc = db.collection('vendors').document(user_id).get()
-        if user_doc.exists:
-            return User(user_id, user.email, 'vendor')
-        user_doc = db.collection('couriers').document(user_id).get()
-        if user_doc.exists:
-            return User(user_id, user.email, 'courier')
-        return None
+        # Role and email come from the process cache; a miss (at least once a
+        # minute) reads the role directory and checks the session has not
+        # been revoked nor the account disabled
+        identity = cached_identity(session, user_id)
+        if identity is None:
+            identity = resolve_user(db, user_id, session_issued_at(session, user_id))
+            if identity is None:
+                return None
+            remember_identity(session, user_id, *identity)
+        role, email = identity
+        return User(user_id, email, role)
     except:
         return None
 
 # Routes
 @app.route('/')
+@page_cache.cached
 def home():
-    # Get categories with product count
-    categories = []
-    for doc in db.collection('categories').stream():
-        category_data = doc.to_dict()
-        # Get product count for this category
-        product_count = len(list(db.collection('products')
-                               .where('category', '==', category_data.get('categoryName', ''))
-                               .stream()))
-        categories.append({
-            'id': doc.id,
-            'name': category_data.get('categoryName', ''),
-            'icon': category_data.get('icon', 'shopping-bag'),
-            'imageUrl': category_data.get('image', 'https://via.placeholder.com/300x200?text=Category'),
-            'product_count': product_count
-        })
-
-    # Get featured products
-    featured_products = list(db.collection('products')
-                           .where('is_featured', '==', True)
-                           .limit(8)
-                           .stream())
-    featured_products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in featured_products]
-
-    # Get all products
-    all_products = list(db.collection('products').stream())
-    all_products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in all_products]
-
-    return render_template('customer/home.html',
-                         categories=categories,
-                         featured_products=featured_products,
-                         all_products=all_products)
+    # Category tiles, featured products and the first product page all come
+    # from the materialized storefront: no reads while it is current
+    return render_template('customer/home.html', **storefront.context())
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -126,7 +162,7 @@ def login():
         if email == 'admin@admin' and password == 'admin':
             try:
                 # Check if admin exists in Firebase
-                admin_doc = db.collection('admins').document('admin').get()
+                admin_doc = get_document(db.collection('admins').document('admin'))
                 if not admin_doc.exists:
                     # Create admin document if it doesn't exist
                     db.collection('admins').document('admin').set({
@@ -138,6 +174,7 @@ def login():
                 # Create admin user object
                 admin_user = User('admin', 'admin@admin', 'admin')
                 login_user(admin_user)
+                remember_identity(session, admin_user.id, admin_user.role, admin_user.email)
                 return redirect(url_for('admin_dashboard'))
             except Exception as e:
                 flash('Admin login failed', 'danger')
@@ -146,6 +183,8 @@ def login():
         try:
             # Regular user login
             user = auth.get_user_by_email(email)
+            # A fresh sign-in, not bound by an earlier session's revocation
+            forget_identity(session, user.uid)
             user_obj = load_user(user.uid)
             if user_obj:
                 login_user(user_obj)
@@ -173,8 +212,9 @@ def register():
                 email=email,
                 password=password
             )
-            # Create user document in Firestore
-            db.collection('buyers').document(user.uid).set({
+            # Create user document and role directory entry in Firestore
+            batch = db.batch()
+            batch.set(db.collection('buyers').document(user.uid), {
                 'email': email,
                 'fullName': full_name,
                 'phoneNumber': phone_number,
@@ -184,6 +224,8 @@ def register():
                 'createdAt': firestore.SERVER_TIMESTAMP,
                 'updatedAt': firestore.SERVER_TIMESTAMP,
             })
+            set_user_role(db, user.uid, 'buyer', email, batch=batch)
+            batch.commit()
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
         except Exception as e:
@@ -204,6 +246,7 @@ def dashboard():
 @app.route('/logout')
 @login_required
 def logout():
+    forget_identity(session, current_user.id)
     logout_user()
     flash('You have been logged out successfully.', 'success')
     return redirect(url_for('home'))
@@ -216,36 +259,24 @@ def admin_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('home'))
     
-    # Get statistics for admin dashboard
-    total_users = len(list(db.collection('buyers').stream()))
-    total_vendors = len(list(db.collection('vendors').stream()))
-    total_orders = len(list(db.collection('orders').stream()))
-    total_revenue = 0  # You'll need to calculate this from orders
+    # Get statistics for admin dashboard from server-side aggregations
+    totals = dashboard_totals(db)
     
     # Get pending vendors
     pending_vendors = list(db.collection('vendors').where('status', '==', 'pending').stream())
     
-    # Get all users
-    users = []
-    for collection in ['buyers', 'vendors', 'couriers']:
-        for doc in db.collection(collection).stream():
-            user_data = doc.to_dict()
-            users.append({
-                'id': doc.id,
-                'name': user_data.get('fullName', 'N/A'),
-                'email': user_data.get('email', 'N/A'),
-                'role': collection[:-1],  # Remove 's' from end
-                'is_active': user_data.get('status', 'active') == 'active',
-                'created_at': user_data.get('createdAt', None)
-            })
+    # Get one page of users
+    users_role = request.args.get('users_role', 'all')
+    if users_role not in ('all',) + USER_COLLECTIONS:
+        users_role = 'all'
+    users, users_next_cursor = fetch_users_page(db, users_role, request.args.get('users_cursor'))
     
     return render_template('admin/admin_dashboard.html',
-                         total_users=total_users,
-                         total_vendors=total_vendors,
-                         total_orders=total_orders,
-                         total_revenue=total_revenue,
                          pending_vendors=pending_vendors,
-                         users=users)
+                         users=users,
+                         users_role=users_role,
+                         users_next_cursor=users_next_cursor,
+                         **totals)
 
 # Add other dashboard routes
 @app.route('/buyer/dashboard')
@@ -255,58 +286,7 @@ def buyer_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('home'))
     
-    # Get categories with product count
-    categories = []
-    for doc in db.collection('categories').stream():
-        category_data = doc.to_dict()
-        # Get product count for this category
-        product_count = len(list(db.collection('products')
-                               .where('category', '==', category_data.get('categoryName', ''))
-                               .stream()))
-        categories.append({
-            'id': doc.id,
-            'name': category_data.get('categoryName', ''),
-            'icon': category_data.get('icon', 'shopping-bag'),
-            'product_count': product_count
-        })
-    
-    # Get featured products
-    featured_products = list(db.collection('products')
-                           .where('is_featured', '==', True)
-                           .limit(8)
-                           .stream())
-    featured_products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in featured_products]
-    
-    # Get all products
-    all_products = list(db.collection('products').stream())
-    all_products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in all_products]
-    
-    return render_template('customer/home.html',
-                         categories=categories,
-                         featured_products=featured_products,
-                         all_products=all_products)
+    return render_template('customer/home.html', **storefront.context())
 
 @app.route('/vendor/dashboard')
 @login_required
@@ -315,28 +295,32 @@ def vendor_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('home'))
     
-    # Get vendor statistics
-    vendor_doc = db.collection('vendors').document(current_user.id).get()
-    vendor_data = vendor_doc.to_dict() if vendor_doc.exists else {}
-    
-    # Get vendor's products
-    products = list(db.collection('products').where('vendor_id', '==', current_user.id).stream())
-    
-    # Get vendor's orders
-    orders = list(db.collection('orders').where('vendorId', '==', current_user.id).stream())
-    
-    total_sales = sum(order.get('totalAmount', 0) for order in orders)
-    total_orders = len(orders)
-    total_products = len(products)
-    pending_orders = len([order for order in orders if order.get('status') == 'pending'])
+    vendor_products = db.collection('products').where('vendorId', '==', current_user.id)
+    with FanOut() as reads:
+        deadline = rpc_deadline(reads.timeout)
+        # Vendor statistics from the incrementally maintained rollup
+        reads.submit('stats', get_vendor_stats, db, current_user.id)
+        # How many products the vendor has, and a few of them (the lists
+        # fall back to empty; the figures above them are required)
+        reads.submit('total_products', lambda: int(vendor_products.count().get(**deadline)[0][0].value))
+        reads.submit('products', lambda: list(vendor_products.select(Product.LISTING_FIELDS)
+                                              .limit(VENDOR_PRODUCTS_LIMIT).stream(**deadline)), default=[])
+        # The vendor's most recent orders
+        reads.submit('recent', lambda: recent_orders(db, current_user.id, limit=5, timeout=reads.timeout),
+                     default=[])
+        
+        stats = reads.result('stats')
+        total_products = reads.result('total_products')
+        products = [Product.from_snapshot(doc) for doc in reads.result('products')]
+        recent = [Order.from_snapshot(doc) for doc in reads.result('recent')]
     
     return render_template('vendor/vendor_dashboard.html',
-                         total_sales=total_sales,
-                         total_orders=total_orders,
+                         total_sales=stats.get('totalSales', 0),
+                         total_orders=stats.get('totalOrders', 0),
                          total_products=total_products,
-                         pending_orders=pending_orders,
+                         pending_orders=stats.get('pendingOrders', 0),
                          products=products,
-                         recent_orders=orders[:5])  # Show only 5 most recent orders
+                         recent_orders=recent)
 
 @app.route('/courier/dashboard')
 @login_required
@@ -360,26 +344,26 @@ def add_to_cart():
     
     try:
         # Get product details
-        product_doc = db.collection('products').document(product_id).get()
+        product_doc = get_document(db.collection('products').document(product_id))
         if not product_doc.exists:
             return jsonify({'success': False, 'message': 'Product not found'}), 404
         
-        product_data = product_doc.to_dict()
+        product = Product.from_snapshot(product_doc)
         
         # Check if product is in stock
-        if product_data.get('quantity', 0) < quantity:
+        if product.stock < quantity:
             return jsonify({'success': False, 'message': 'Not enough stock available'}), 400
         
         # Add to cart in Firestore
         cart_ref = db.collection('users').document(current_user.id).collection('cart').document(product_id)
         cart_ref.set({
             'productId': product_id,
-            'productName': product_data.get('productName'),
-            'productPrice': product_data.get('productPrice'),
-            'imageUrl': product_data.get('imageUrlList', [''])[0],
+            'productName': product.name,
+            'productPrice': product.price,
+            'imageUrl': product.images[0] if product.images else '',
             'quantity': quantity,
             'size': size,
-            'vendorId': product_data.get('vendorId'),
+            'vendorId': product.vendor_id,
             'addedAt': firestore.SERVER_TIMESTAMP
         }, merge=True)
         
@@ -396,44 +380,42 @@ def search():
     query = request.args.get('q', '').strip()
     if not query:
         return redirect(url_for('home'))
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', 24, type=int), 1), 100)
     
     try:
-        # Search products by name, brand, or category
-        products_query = db.collection('products')
-        products = []
-        
-        # Get all products and filter in Python to allow for partial matches
-        all_products = list(products_query.stream())
-        for doc in all_products:
-            product_data = doc.to_dict()
-            # Check if query matches product name, brand, or category (case insensitive)
-            if (query.lower() in product_data.get('productName', '').lower() or
-                query.lower() in product_data.get('brandName', '').lower() or
-                query.lower() in product_data.get('category', '').lower()):
-                products.append({
-                    'id': doc.id,
-                    'productName': product_data.get('productName', ''),
-                    'productPrice': product_data.get('productPrice', 0.0),
-                    'brandName': product_data.get('brandName', ''),
-                    'imageUrlList': product_data.get('imageUrlList', []),
-                    'rating': product_data.get('rating', 0.0),
-                    'reviewCount': product_data.get('reviewCount', 0),
-                    'productDescription': product_data.get('productDescription', ''),
-                    'category': product_data.get('category', ''),
-                    'quantity': product_data.get('quantity', 0)
-                })
-        
-        # Sort products by relevance (exact matches first)
-        products.sort(key=lambda x: (
-            query.lower() not in x['productName'].lower(),  # Exact matches in name first
-            query.lower() not in x['brandName'].lower(),    # Then brand matches
-            query.lower() not in x['category'].lower()      # Then category matches
-        ))
+        if product_provider.available:
+            # Ranked lookup in the inverted index kept in step with the catalog
+            result_count, product_ids = search_index.search(query, page=page, limit=limit)
+            products = product_provider.get_products(product_ids)
+        else:
+            # Search products by name, brand, or category
+            products = []
+            
+            # Filter the catalog in Python to allow for partial matches
+            for product in product_provider.all_products():
+                # Check if query matches product name, brand, or category (case insensitive)
+                if (query.lower() in product.name.lower() or
+                    query.lower() in product.brand.lower() or
+                    query.lower() in product.category.lower()):
+                    products.append(product)
+            
+            # Sort products by relevance (exact matches first)
+            products.sort(key=lambda x: (
+                query.lower() not in x.name.lower(),  # Exact matches in name first
+                query.lower() not in x.brand.lower(),    # Then brand matches
+                query.lower() not in x.category.lower()      # Then category matches
+            ))
+            result_count = len(products)
+            products = products[(page - 1) * limit:page * limit]
         
         return render_template('customer/search_results.html', 
                              products=products, 
                              query=query,
-                             result_count=len(products))
+                             result_count=result_count,
+                             page=page,
+                             limit=limit,
+                             has_next=page * limit < result_count)
                              
     except Exception as e:
         flash(f'Error performing search: {str(e)}', 'danger')
@@ -452,16 +434,30 @@ def cart():
     subtotal = 0
     shipping_total = 0
     
-    for item in cart_items:
-        item_data = item.to_dict()
-        product_doc = db.collection('products').document(item_data['productId']).get()
-        if product_doc.exists:
-            product_data = product_doc.to_dict()
-            vendor_doc = db.collection('vendors').document(product_data.get('vendorId')).get()
-            vendor_data = vendor_doc.to_dict() if vendor_doc.exists else {}
+    # Fetch every product and every distinct vendor in one batch; cart lines
+    # carry the vendor id, so both can go in the same round trip
+    cart_data = [(item, item.to_dict()) for item in cart_items]
+    found = get_many_by_collection(db, {
+        'products': [item_data['productId'] for _, item_data in cart_data],
+        'vendors': [item_data.get('vendorId') for _, item_data in cart_data]
+    })
+    products_by_id = {product_id: Product.from_dict(data, id=product_id)
+                      for product_id, data in found['products'].items()}
+    vendors_by_id = found['vendors']
+    
+    # Older cart lines may lack the vendor id; pick those vendors up in one more batch
+    missing_vendor_ids = [p.vendor_id for p in products_by_id.values()
+                          if p.vendor_id not in vendors_by_id]
+    if missing_vendor_ids:
+        vendors_by_id.update(get_many(db, 'vendors', missing_vendor_ids))
+    
+    for item, item_data in cart_data:
+        product = products_by_id.get(item_data['productId'])
+        if product is not None:
+            vendor_data = vendors_by_id.get(product.vendor_id, {})
             
             item_total = item_data.get('productPrice', 0) * item_data.get('quantity', 1)
-            shipping_charge = product_data.get('shippingCharge', 0) if product_data.get('chargeShipping', False) else 0
+            shipping_charge = product.shipping_charge if product.charge_shipping else 0
             
             cart_products.append({
                 'id': item.id,
@@ -532,29 +528,37 @@ def checkout():
         flash('Access denied', 'danger')
         return redirect(url_for('home'))
     
-    # Get cart items
-    cart_items = list(db.collection('users').document(current_user.id).collection('cart').stream())
+    # The cart lines and the buyer's saved shipping details are independent reads
+    with FanOut() as reads:
+        deadline = rpc_deadline(reads.timeout)
+        reads.submit('cart', lambda: list(db.collection('users').document(current_user.id)
+                                          .collection('cart').stream(**deadline)))
+        reads.submit('buyer', lambda: db.collection('buyers').document(current_user.id).get(**deadline))
+        cart_items = reads.result('cart')
+        user_doc = reads.result('buyer')
     cart_products = []
     totalAmount = 0
     
-    for item in cart_items:
-        item_data = item.to_dict()
-        product_doc = db.collection('products').document(item_data['productId']).get()
-        if product_doc.exists:
-            product_data = product_doc.to_dict()
+    # Fetch every product in the cart in one batch
+    cart_data = [item.to_dict() for item in cart_items]
+    products_by_id = get_many(db, 'products', [item_data['productId'] for item_data in cart_data])
+    
+    for item_data in cart_data:
+        product_data = products_by_id.get(item_data['productId'])
+        if product_data is not None:
+            product = Product.from_dict(product_data, id=item_data['productId'])
             cart_products.append({
-                'productId': item_data['productId'],
-                'productName': product_data.get('productName'),
-                'price': product_data.get('productPrice', 0),
-                'imageUrl': product_data.get('imageUrlList', [''])[0],
+                'productId': product.id,
+                'productName': product.name,
+                'price': product.price,
+                'imageUrl': product.images[0] if product.images else '',
                 'quantity': item_data.get('quantity', 1),
                 'size': item_data.get('size'),
-                'vendorId': product_data.get('vendorId')
+                'vendorId': product.vendor_id
             })
-            totalAmount += product_data.get('productPrice', 0) * item_data.get('quantity', 1)
+            totalAmount += product.price * item_data.get('quantity', 1)
     
     # Get user's shipping address
-    user_doc = db.collection('buyers').document(current_user.id).get()
     user_data = user_doc.to_dict() if user_doc.exists else {}
     
     return render_template('customer/checkout.html', 
@@ -574,33 +578,10 @@ def orders():
                  .where('buyerId', '==', current_user.id)
                  .stream())
     
-    orders_list = []
-    for order in orders:
-        # Convert Firestore document to dictionary
-        order_dict = order.to_dict()
-        
-        # Create order object with exact field names from Firestore
-        order_obj = {
-            'orderId': str(order_dict.get('orderId', '')),
-            'buyerId': str(order_dict.get('buyerId', '')),
-            'buyerName': str(order_dict.get('buyerName', '')),
-            'buyerPhone': str(order_dict.get('buyerPhone', '')),
-            'courierId': str(order_dict.get('courierId', '')),
-            'courierName': str(order_dict.get('courierName', '')),
-            'createdAt': order_dict.get('createdAt'),
-            'pickedUpAt': order_dict.get('pickedUpAt'),
-            'paymentMethod': str(order_dict.get('paymentMethod', '')),
-            'products': order_dict.get('products', []),
-            'shippingAddress': str(order_dict.get('shippingAddress', '')),
-            'status': str(order_dict.get('status', '')),
-            'totalAmount': float(order_dict.get('totalAmount', 0)),
-            'updatedAt': order_dict.get('updatedAt'),
-            'vendorId': str(order_dict.get('vendorId', ''))
-        }
-        orders_list.append(order_obj)
+    orders_list = [Order.from_snapshot(order) for order in orders]
     
     # Sort orders by creation date
-    orders_list.sort(key=lambda x: x['createdAt'] if x['createdAt'] else '', reverse=True)
+    orders_list.sort(key=lambda x: x.created_at.timestamp() if x.created_at else 0, reverse=True)
     
     return render_template('customer/orders.html', orders=orders_list)
 
@@ -612,35 +593,16 @@ def order_details(order_id):
         return redirect(url_for('home'))
     
     # Get order details
-    order_doc = db.collection('orders').document(order_id).get()
+    order_doc = get_document(db.collection('orders').document(order_id))
     if not order_doc.exists:
         flash('Order not found', 'danger')
         return redirect(url_for('orders'))
     
-    order_data = order_doc.to_dict()
-    if order_data.get('buyerId') != current_user.id:
+    order = Order.from_snapshot(order_doc)
+    if order.buyer_id != current_user.id:
         flash('Access denied', 'danger')
         return redirect(url_for('orders'))
     
-    # Create order object with exact field names
-    order = {
-        'orderId': str(order_data.get('orderId', '')),
-        'buyerId': str(order_data.get('buyerId', '')),
-        'buyerName': str(order_data.get('buyerName', '')),
-        'buyerPhone': str(order_data.get('buyerPhone', '')),
-        'courierId': str(order_data.get('courierId', '')),
-        'courierName': str(order_data.get('courierName', '')),
-        'createdAt': order_data.get('createdAt'),
-        'pickedUpAt': order_data.get('pickedUpAt'),
-        'paymentMethod': str(order_data.get('paymentMethod', '')),
-        'products': order_data.get('products', []),
-        'shippingAddress': str(order_data.get('shippingAddress', '')),
-        'status': str(order_data.get('status', '')),
-        'totalAmount': float(order_data.get('totalAmount', 0)),
-        'updatedAt': order_data.get('updatedAt'),
-        'vendorId': str(order_data.get('vendorId', ''))
-    }
-    
     return render_template('customer/order_details.html', order=order)
 
 @app.route('/api/order/cancel/<order_id>', methods=['POST'])
@@ -650,7 +612,7 @@ def cancel_order(order_id):
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
     try:
-        order_doc = db.collection('orders').document(order_id).get()
+        order_doc = get_document(db.collection('orders').document(order_id))
         if not order_doc.exists:
             return jsonify({'success': False, 'message': 'Order not found'}), 404
         
@@ -661,11 +623,14 @@ def cancel_order(order_id):
         if order_data.get('status') not in ['pending', 'processing']:
             return jsonify({'success': False, 'message': 'Order cannot be cancelled'}), 400
         
-        # Update order status
-        db.collection('orders').document(order_id).update({
+        # Update order status and the vendor's rollup together
+        batch = db.batch()
+        batch.update(db.collection('orders').document(order_id), {
             'status': 'cancelled',
             'updatedAt': firestore.SERVER_TIMESTAMP
         })
+        record_status_change(db, batch, order_data, 'cancelled')
+        batch.commit()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -694,6 +659,10 @@ def payment_status_color(status):
     }
     return colors.get(status.lower(), 'secondary')
 
+@app.template_filter('trace_time')
+def trace_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else ''
+
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
@@ -725,7 +694,7 @@ def profile():
             flash(f'Error updating profile: {str(e)}', 'danger')
     
     # Get user data
-    user_doc = db.collection('buyers').document(current_user.id).get()
+    user_doc = get_document(db.collection('buyers').document(current_user.id))
     user_data = user_doc.to_dict() if user_doc.exists else {}
     
     return render_template('customer/profile.html', user=user_data)
@@ -756,181 +725,397 @@ def change_password():
 @app.route('/profile/upload-photo', methods=['POST'])
 @login_required
 def upload_profile_photo():
-    if 'photo' not in request.files:
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        flash(f'Images must be smaller than {images.MAX_UPLOAD_BYTES // (1024 * 1024)} MB', 'danger')
+        return redirect(url_for('profile'))
+    if 'photo' not in files:
         flash('No file selected', 'danger')
         return redirect(url_for('profile'))
     
-    file = request.files['photo']
+    file = files['photo']
     if file.filename == '':
         flash('No file selected', 'danger')
         return redirect(url_for('profile'))
     
     try:
-        # Here you would typically upload the file to your storage service
-        # For now, we'll just update the profile with a placeholder
+        photo_url = image_pipeline.ingest(file.read())
         user_ref = db.collection('buyers').document(current_user.id)
         user_ref.update({
-            'profileImage': 'https://via.placeholder.com/150',
+            'profileImage': photo_url,
             'updatedAt': firestore.SERVER_TIMESTAMP
         })
         
         flash('Profile photo updated successfully', 'success')
+    except ImageError as e:
+        flash(str(e), 'danger')
     except Exception as e:
         flash(f'Error uploading photo: {str(e)}', 'danger')
     
     return redirect(url_for('profile'))
 
-@app.route('/products')
-def all_products():
-    # Get filter parameters
-    sort = request.args.get('sort', 'newest')
-    price_range = request.args.get('price_range', '')
-    min_rating = request.args.get('rating', '')
-    
-    # Base query
+def product_listing_query(sort='newest', price_range='', min_rating=''):
+    # Build the filtered and sorted /products query; returns the query and
+    # the field it is ordered by, for cursor pagination
     products_query = db.collection('products')
     
     # Apply price range filter
-    if price_range:
-        if price_range == '0-25':
-            products_query = products_query.where('productPrice', '<=', 25)
-        elif price_range == '25-50':
-            products_query = products_query.where('productPrice', '>=', 25).where('productPrice', '<=', 50)
-        elif price_range == '50-100':
-            products_query = products_query.where('productPrice', '>=', 50).where('productPrice', '<=', 100)
-        elif price_range == '100+':
-            products_query = products_query.where('productPrice', '>=', 100)
+    min_price, max_price = price_bounds(price_range)
+    if min_price is not None:
+        products_query = products_query.where('productPrice', '>=', min_price)
+    if max_price is not None:
+        products_query = products_query.where('productPrice', '<=', max_price)
     
     # Apply rating filter
-    if min_rating:
-        products_query = products_query.where('rating', '>=', float(min_rating))
+    min_rating = rating_bound(min_rating)
+    if min_rating is not None:
+        products_query = products_query.where('rating', '>=', min_rating)
     
     # Apply sorting
     if sort == 'price_low':
-        products_query = products_query.order_by('productPrice')
+        return products_query.order_by('productPrice'), ['productPrice'], firestore.Query.ASCENDING
     elif sort == 'price_high':
-        products_query = products_query.order_by('productPrice', direction=firestore.Query.DESCENDING)
+        return (products_query.order_by('productPrice', direction=firestore.Query.DESCENDING),
+                ['productPrice'], firestore.Query.DESCENDING)
     elif sort == 'rating':
-        products_query = products_query.order_by('rating', direction=firestore.Query.DESCENDING)
-    else:  # newest
-        products_query = products_query.order_by('createdAt', direction=firestore.Query.DESCENDING)
-    
-    # Get products
-    products = list(products_query.stream())
-    products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in products]
+        return (products_query.order_by('rating', direction=firestore.Query.DESCENDING),
+                ['rating'], firestore.Query.DESCENDING)
+    # newest
+    return (products_query.order_by('createdAt', direction=firestore.Query.DESCENDING),
+            ['createdAt'], firestore.Query.DESCENDING)
+
+def category_listing_query(category_name):
+    # Equality filter ordered by document id only, so no composite index is needed
+    query = db.collection('products').where('category', '==', category_name)
+    return query, [], firestore.Query.ASCENDING
+
+def fetch_product_page(query, order_fields, direction, cursor=None, fields=Product.LISTING_FIELDS,
+                       page_size=PAGE_SIZE):
+    # Only the fields a product card shows (or the given ones), plus whatever the cursor needs
+    query = query.select(list(dict.fromkeys(fields + order_fields)))
+    docs, next_cursor = fetch_page(query, order_fields, cursor=cursor, direction=direction, page_size=page_size)
+    return [Product.from_snapshot(doc) for doc in docs], next_cursor
+
+def use_mirror():
+    return product_provider.available and catalog_mirror.ready
+
+def listing_filters(price_range='', min_rating='', category_name=None):
+    min_price, max_price = price_bounds(price_range)
+    return {'category': category_name, 'min_price': min_price, 'max_price': max_price,
+            'min_rating': rating_bound(min_rating)}
+
+def product_listing(sort='newest', price_range='', min_rating='', category_name=None, cursor=None,
+                    fields=Product.LISTING_FIELDS, page_size=PAGE_SIZE):
+    # One page of a product listing: (products, next_cursor). The local
+    # mirror takes any combination of filters; the Firestore fallback has no
+    # index for filters within a category and lists those by id (see
+    # listing_filters_dropped). A cursor the other path issued raises
+    # CursorMismatchError rather than silently starting over.
+    if use_mirror():
+        check_cursor(cursor, 1)
+        product_ids, next_cursor = catalog_mirror.page(sort, cursor, page_size,
+                                                       **listing_filters(price_range, min_rating, category_name))
+        return product_provider.get_products(product_ids), next_cursor
+    if category_name is not None:
+        listing = category_listing_query(category_name)
+    else:
+        listing = product_listing_query(sort, price_range, min_rating)
+    check_cursor(cursor, len(listing[1]))
+    return fetch_product_page(*listing, cursor=cursor, fields=fields, page_size=page_size)
+
+def listing_filters_dropped(sort='newest', price_range='', min_rating='', category_name=None):
+    # True when a category listing falls back to Firestore and cannot apply
+    # the requested sort or filters
+    if category_name is None or use_mirror():
+        return False
+    return (sort not in ('', 'newest') or price_bounds(price_range) != (None, None)
+            or rating_bound(min_rating) is not None)
+
+def restart_listing():
+    # Redirect a listing page to its first page, keeping its filters
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    return redirect(url_for(request.endpoint, **(request.view_args or {}), **args))
+
+def product_count(price_range='', min_rating='', category_name=None):
+    # Number of products matching the filters, or None without the mirror
+    if not use_mirror():
+        return None
+    return catalog_mirror.count(**listing_filters(price_range, min_rating, category_name))
+
+@app.route('/products')
+@page_cache.cached
+def all_products():
+    # Get filter parameters
+    sort = request.args.get('sort', 'newest')
+    price_range = request.args.get('price_range', '')
+    min_rating = request.args.get('rating', '')
+    
+    # Get one page of products
+    try:
+        products, next_cursor = product_listing(sort, price_range, min_rating, cursor=request.args.get('cursor'))
+    except CursorMismatchError:
+        return restart_listing()
     
     # Get categories for filter sidebar
-    categories = list(db.collection('categories').stream())
-    categories = [{'id': doc.id, **doc.to_dict()} for doc in categories]
+    categories = product_provider.categories()
     
     return render_template('customer/all_products.html',
                          products=products,
+                         next_cursor=next_cursor,
+                         total_count=product_count(price_range, min_rating),
                          categories=categories,
                          current_sort=sort,
                          current_price_range=price_range,
                          current_rating=min_rating)
 
 @app.route('/category/<category_id>')
+@page_cache.cached
 def category_products(category_id):
     # Get category details
-    category_doc = db.collection('categories').document(category_id).get()
+    category_doc = get_document(db.collection('categories').document(category_id))
     if not category_doc.exists:
         flash('Category not found', 'danger')
         return redirect(url_for('home'))
     
     category_data = category_doc.to_dict()
+    category_name = category_data.get('categoryName', '')
+    sort = request.args.get('sort', 'newest')
+    price_range = request.args.get('price_range', '')
+    min_rating = request.args.get('rating', '')
     
-    # Get products in this category
-    products = list(db.collection('products')
-                   .where('category', '==', category_data.get('categoryName', ''))
-                   .stream())
-    
-    # Format products to match Flutter structure
-    products = [{
-        'id': doc.id,
-        'productName': doc.to_dict().get('productName', ''),
-        'productPrice': doc.to_dict().get('productPrice', 0.0),
-        'brandName': doc.to_dict().get('brandName', ''),
-        'imageUrlList': doc.to_dict().get('imageUrlList', []),
-        'rating': doc.to_dict().get('rating', 0.0),
-        'reviewCount': doc.to_dict().get('reviewCount', 0),
-        'productDescription': doc.to_dict().get('productDescription', ''),
-        'category': doc.to_dict().get('category', ''),
-        'quantity': doc.to_dict().get('quantity', 0)
-    } for doc in products]
+    # Get one page of products in this category
+    try:
+        products, next_cursor = product_listing(sort, price_range, min_rating, category_name,
+                                                cursor=request.args.get('cursor'))
+    except CursorMismatchError:
+        return restart_listing()
     
     return render_template('customer/category_products.html',
                          category=category_data,
-                         products=products)
+                         category_id=category_id,
+                         products=products,
+                         next_cursor=next_cursor,
+                         total_count=product_count(price_range, min_rating, category_name),
+                         filters_dropped=listing_filters_dropped(sort, price_range, min_rating, category_name),
+                         current_sort=sort,
+                         current_price_range=price_range,
+                         current_rating=min_rating)
+
+@app.route('/api/products/page')
+def products_page():
+    # Next page of a product grid as a rendered HTML fragment, for infinite scroll
+    view = request.args.get('view', 'grid')
+    cursor = request.args.get('cursor')
+    category_id = request.args.get('category_id')
+    
+    category_name = None
+    if category_id:
+        category_name = catalog_mirror.category_name(category_id) if use_mirror() else None
+        if category_name is None:
+            category_doc = get_document(db.collection('categories').document(category_id))
+            if not category_doc.exists:
+                return jsonify({'success': False, 'message': 'Category not found'}), 404
+            category_name = category_doc.to_dict().get('categoryName', '')
+    
+    try:
+        products, next_cursor = product_listing(request.args.get('sort', 'newest'),
+                                                request.args.get('price_range', ''),
+                                                request.args.get('rating', ''),
+                                                category_name, cursor=cursor)
+    except CursorMismatchError:
+        return jsonify({'success': False, 'message': 'This listing has changed; reload the page to see more'}), 409
+    template = 'customer/partials/home_product_card.html' if view == 'home' else 'customer/partials/product_card.html'
+    html = ''.join(render_template(template, product=product) for product in products)
+    
+    return jsonify({
+        'success': True,
+        'html': html,
+        'count': len(products),
+        'next_cursor': next_cursor
+    })
+
+def api_error(message, status):
+    return jsonify({'success': False, 'message': message}), status
+
+def api_fields(allowed, default):
+    # Fields named in ?fields=a,b (all of `default` when absent); None if any is unknown
+    requested = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not requested:
+        return default
+    if allowed is not None and any(field not in allowed for field in requested):
+        return None
+    return list(dict.fromkeys(requested))
+
+def api_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def product_json(product, fields):
+    data = product.to_dict()
+    return {field: data.get(field) for field in fields}
+
+def catalog_json(build):
+    # Serve the JSON built by build() (None for not found) with a strong ETag,
+    # compressed, and as 304 when the client has it. While the catalog
+    # listener runs, any product or category write changes its version, so
+    # the reply is kept per version and a repeat request skips build().
+    key = None
+    version = catalog_version()
+    if version is not None:
+        key = (version, request.path, request.query_string)
+        representation = api_responses.get(key)
+        if representation is not None:
+            return representation.respond(app)
+    payload = build()
+    if payload is None:
+        return api_error('Not found', 404)
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True, default=api_json_value).encode()
+    representation = Representation(body, 'application/json')
+    if key is not None:
+        api_responses.set(key, representation)
+    return representation.respond(app)
+
+@app.route('/api/v1/categories')
+def api_categories():
+    fields = api_fields(None, None)
+    def build():
+        categories = sorted(product_provider.categories(), key=lambda category: category['id'])
+        if fields is not None:
+            categories = [{field: category.get(field) for field in ['id'] + fields} for category in categories]
+        return {'categories': categories}
+    return catalog_json(build)
+
+@app.route('/api/v1/products')
+def api_products():
+    # One page of products: ?fields=, ?limit=, ?cursor= (from nextCursor) and
+    # the /products filters (sort, price_range, rating) or ?category_id=
+    fields = api_fields(PRODUCT_API_FIELDS, PRODUCT_API_DEFAULT_FIELDS)
+    if fields is None:
+        return api_error(f"Unknown field; choose from {', '.join(PRODUCT_API_FIELDS)}", 400)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), API_PAGE_SIZE_MAX)
+    rating = request.args.get('rating', '')
+    if rating and rating_bound(rating) is None:
+        return api_error('rating must be a number', 400)
+
+    def build():
+        category_id = request.args.get('category_id')
+        category_name = None
+        if category_id:
+            category = next((c for c in product_provider.categories() if c['id'] == category_id), None)
+            if category is None:
+                return None
+            category_name = category.get('categoryName', '')
+        stored_fields = [field for field in fields if field != 'productId']
+        products, next_cursor = product_listing(request.args.get('sort', 'newest'),
+                                                request.args.get('price_range', ''), rating, category_name,
+                                                cursor=request.args.get('cursor'), fields=stored_fields,
+                                                page_size=limit)
+        return {'products': [product_json(product, fields) for product in products],
+                'count': len(products),
+                'total': product_count(request.args.get('price_range', ''), rating, category_name),
+                'nextCursor': next_cursor}
+    try:
+        return catalog_json(build)
+    except CursorMismatchError:
+        return api_error('cursor no longer matches this listing; start again without it', 409)
+
+@app.route('/api/v1/products/<product_id>')
+def api_product(product_id):
+    fields = api_fields(PRODUCT_API_FIELDS, PRODUCT_API_FIELDS)
+    if fields is None:
+        return api_error(f"Unknown field; choose from {', '.join(PRODUCT_API_FIELDS)}", 400)
+    def build():
+        product = product_provider.get_product(product_id)
+        return None if product is None else {'product': product_json(product, fields)}
+    return catalog_json(build)
 
 @app.route('/product/<product_id>')
+@page_cache.cached
 def product_details(product_id):
     # Get product details
-    product_doc = db.collection('products').document(product_id).get()
-    if not product_doc.exists:
+    product = product_provider.get_product(product_id)
+    if product is None:
         flash('Product not found', 'danger')
         return redirect(url_for('home'))
     
-    product_data = product_doc.to_dict()
-    product_data['id'] = product_id  # Add the document ID to the data
-    
-    # Get vendor details
-    vendor_doc = db.collection('vendors').document(product_data.get('vendorId')).get()
-    vendor_data = vendor_doc.to_dict() if vendor_doc.exists else {}
-    
-    # Get product reviews
-    reviews = list(db.collection('products').document(product_id).collection('reviews').stream())
-    reviews_list = []
-    for review in reviews:
-        review_data = review.to_dict()
-        reviews_list.append({
-            'id': review.id,
-            'rating': review_data.get('rating', 0),
-            'comment': review_data.get('comment', ''),
-            'createdAt': review_data.get('createdAt'),
-            'userName': review_data.get('userName', 'Anonymous'),
-            'isVerifiedPurchase': review_data.get('isVerifiedPurchase', False),
-            'userImage': review_data.get('userImage', '')
-        })
-    
-    # Sort reviews by date (newest first)
-    reviews_list.sort(key=lambda x: x['createdAt'] if x['createdAt'] else '', reverse=True)
-    
-    # Get related products (same category) - Modified to avoid index
-    all_products = list(db.collection('products').stream())
-    related_products = []
-    for doc in all_products:
-        doc_data = doc.to_dict()
-        if (doc.id != product_id and 
-            doc_data.get('category') == product_data.get('category')):
-            related_products.append({
-                'id': doc.id,
-                'productName': doc_data.get('productName', ''),
-                'productPrice': doc_data.get('productPrice', 0.0),
-                'imageUrlList': doc_data.get('imageUrlList', []),
-                'rating': doc_data.get('rating', 0.0),
-                'productId': doc.id
-            })
-            if len(related_products) >= 4:  # Limit to 4 related products
-                break
+    # The vendor, the reviews and the related products only depend on the
+    # product, so read them concurrently
+    # Only the product itself is required: a slow or failed read of anything
+    # else leaves that part of the page empty instead of failing it
+    with FanOut() as reads:
+        # The reads carry the deadline themselves too, so one given up on
+        # frees its pool thread instead of waiting on Firestore
+        deadline = rpc_deadline(reads.timeout)
+        reads.submit('vendor', lambda: db.collection('vendors').document(product.vendor_id).get(**deadline).to_dict()
+                     or {}, default={})
+        reads.submit('reviews', lambda: reviews_page(db, product_id, timeout=reads.timeout), default=([], None))
+        if not product_provider.available:
+            reads.submit('related', lambda: list(db.collection('products')
+                                                 .where('category', '==', product.category)
+                                                 .select(Product.LISTING_FIELDS)
+                                                 .limit(RELATED_LIMIT + 1)
+                                                 .stream(**deadline)), default=[])
+        
+        # Get vendor details
+        vendor_data = reads.result('vendor')
+        
+        # Get the first page of reviews, newest first
+        reviews_list, reviews_cursor = reads.result('reviews')
+        
+        # Get related products (same category, in stock, best rated first)
+        if product_provider.available:
+            related_products = related_index.related(product_id, product.category)
+        else:
+            related_products = [related for related in map(Product.from_snapshot, reads.result('related'))
+                                if related.id != product_id and related.stock > 0][:RELATED_LIMIT]
     
     return render_template('customer/product_details.html',
-                         product=product_data,
+                         product=product,
                          vendor=vendor_data,
                          reviews=reviews_list,
+                         reviews_cursor=reviews_cursor,
                          related_products=related_products)
 
+@app.route('/api/products/<product_id>/reviews')
+def product_reviews_page(product_id):
+    # Next page of a product's reviews as a rendered HTML fragment
+    reviews, next_cursor = reviews_page(db, product_id, cursor=request.args.get('cursor'))
+    html = ''.join(render_template('customer/partials/review.html', review=review) for review in reviews)
+    
+    return jsonify({
+        'success': True,
+        'html': html,
+        'count': len(reviews),
+        'next_cursor': next_cursor
+    })
+
+@app.route('/product/<product_id>/review', methods=['POST'])
+@login_required
+def review_product(product_id):
+    if current_user.role != 'buyer':
+        flash('Access denied', 'danger')
+        return redirect(url_for('product_details', product_id=product_id))
+    
+    buyer_doc = get_document(db.collection('buyers').document(current_user.id))
+    buyer_data = buyer_doc.to_dict() if buyer_doc.exists else {}
+    
+    try:
+        submit_review(db, product_id, current_user.id,
+                      request.form.get('rating'),
+                      request.form.get('comment'),
+                      user_name=buyer_data.get('fullName'),
+                      user_image=buyer_data.get('profileImage'))
+        flash('Thanks for your review!', 'success')
+    except ReviewError as e:
+        flash(str(e), 'danger')
+    except Exception as e:
+        flash(f'Error saving review: {str(e)}', 'danger')
+    
+    return redirect(url_for('product_details', product_id=product_id))
+
 @app.route('/place_order', methods=['POST'])
 @login_required
 def place_order():
@@ -945,65 +1130,19 @@ def place_order():
         shipping_address = request.form.get('address')
         payment_method = request.form.get('paymentMethod', 'Cash on Delivery')
         
-        # Get cart items
-        cart_items = list(db.collection('users').document(current_user.id).collection('cart').stream())
-        products = []
-        total_amount = 0
-        vendor_id = None
-        
-        for item in cart_items:
-            item_data = item.to_dict()
-            product_doc = db.collection('products').document(item_data['productId']).get()
-            if product_doc.exists:
-                product_data = product_doc.to_dict()
-                item_total = product_data.get('productPrice', 0) * item_data.get('quantity', 1)
-                total_amount += item_total
-                
-                # Get vendor ID from the first product
-                if vendor_id is None:
-                    vendor_id = product_data.get('vendorId')
-                
-                products.append({
-                    'productId': item_data['productId'],
-                    'productName': product_data.get('productName'),
-                    'price': product_data.get('productPrice', 0),
-                    'quantity': item_data.get('quantity', 1),
-                    'size': item_data.get('size'),
-                    'imageUrl': product_data.get('imageUrlList', [''])[0],
-                    'vendorId': product_data.get('vendorId')
-                })
-        
-        if not vendor_id:
-            flash('No valid vendor found for the products', 'danger')
-            return redirect(url_for('checkout'))
-        
-        # Create order document
-        order_ref = db.collection('orders').document()
-        order_data = {
-            'orderId': order_ref.id,
-            'buyerId': current_user.id,
-            'vendorId': vendor_id,
-            'buyerName': full_name,
-            'buyerPhone': phone_number,
-            'shippingAddress': shipping_address,
-            'paymentMethod': payment_method,
-            'products': products,
-            'totalAmount': total_amount,
-            'status': 'pending',
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'updatedAt': firestore.SERVER_TIMESTAMP
-        }
-        
-        # Add order to Firestore
-        order_ref.set(order_data)
-        
-        # Clear cart
-        for item in cart_items:
-            item.reference.delete()
+        # Create the order, decrement stock and clear the cart atomically
+        order_id = create_order(db, current_user.id, full_name, phone_number,
+                                shipping_address, payment_method)
         
         flash('Order placed successfully!', 'success')
-        return redirect(url_for('order_details', order_id=order_ref.id))
+        return redirect(url_for('order_details', order_id=order_id))
         
+    except OutOfStockError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('cart'))
+    except OrderError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('checkout'))
     except Exception as e:
         flash(f'Error placing order: {str(e)}', 'danger')
         return redirect(url_for('checkout'))
@@ -1045,8 +1184,11 @@ def test_create_order():
             ]
         }
         
-        # Add order to Firestore
-        order_ref.set(order_data)
+        # Add order to Firestore, with the vendor's rollup
+        batch = db.batch()
+        batch.set(order_ref, order_data)
+        record_order_created(db, batch, order_data)
+        batch.commit()
         
         flash('Test order created successfully!', 'success')
         return redirect(url_for('orders'))
@@ -1065,7 +1207,7 @@ def debug_order(order_id):
     
     try:
         # Get order details
-        order_doc = db.collection('orders').document(order_id).get()
+        order_doc = get_document(db.collection('orders').document(order_id))
         if not order_doc.exists:
             flash('Order not found', 'danger')
             return redirect(url_for('orders'))
@@ -1100,5 +1242,141 @@ def debug_order(order_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/traces')
+@login_required
+def admin_traces():
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('home'))
+    
+    return render_template('admin/traces.html', traces=tracing.recent_traces(),
+                         sample_rate=tracing.SAMPLE_RATE)
+
+@app.route('/admin/traces/<trace_id>')
+@login_required
+def admin_trace_detail(trace_id):
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('home'))
+    
+    trace = tracing.find_trace(trace_id)
+    if trace is None:
+        flash('Trace not found', 'danger')
+        return redirect(url_for('admin_traces'))
+    
+    return render_template('admin/trace_detail.html', trace=trace, rows=tracing.waterfall(trace))
+
+@app.route('/media/<path:key>')
+def media(key):
+    # Only needed for stores the app serves itself (the local-disk one)
+    return media_store.send(key)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text exposition; set METRICS_TOKEN to require a bearer token
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return metrics.metrics_response()
+
+@app.cli.command('reconcile-category-counts')
+def reconcile_category_counts():
+    """Recount products per category and rewrite the counters document."""
+    counts = rebuild_category_counts(db)
+    for name, count in counts.items():
+        print(f'{name}: {count}')
+
+@app.cli.command('rebuild-vendor-stats')
+@click.argument('vendor_id', required=False)
+def rebuild_vendor_stats_command(vendor_id):
+    """Recompute sales rollups for one vendor, or for every vendor."""
+    vendor_ids = [vendor_id] if vendor_id else [doc.id for doc in db.collection('vendors').stream()]
+    for vid in vendor_ids:
+        stats = rebuild_vendor_stats(db, vid)
+        print(f'{vid}: {stats}')
+
+@app.cli.command('rebuild-review-stats')
+@click.argument('product_id')
+def rebuild_review_stats_command(product_id):
+    """Recompute a product's rating sum, count and star histogram from its reviews."""
+    stats = rebuild_review_stats(db, product_id)
+    print(f'{product_id}: {stats}')
+
+@app.cli.command('revoke-sessions')
+@click.argument('uid')
+def revoke_sessions_command(uid):
+    """Sign a user out of every session issued so far."""
+    revoke_sessions(db, uid)
+    print(f'{uid}: sessions revoked')
+
+@app.cli.command('rebuild-storefront')
+def rebuild_storefront_command():
+    """Recompute the materialized storefront document."""
+    data = storefront.rebuild()
+    print(f"{len(data['categories'])} categories, {len(data['featured'])} featured, "
+          f"{len(data['products'])} products")
+
+@app.cli.command('process-product-images')
+@click.option('--limit', type=int, default=None, help='Stop after this many products.')
+def process_product_images_command(limit):
+    """Run product images through the image pipeline and point products at the variants.
+
+    The original URLs are kept in sourceImageUrlList.
+    """
+    import requests
+    processed = 0
+    for doc in db.collection('products').select(['imageUrlList']).stream():
+        if limit is not None and processed >= limit:
+            break
+        urls = doc.to_dict().get('imageUrlList') or []
+        if not urls or all(images.parse_url(url) for url in urls):
+            continue
+        try:
+            external = [url for url in urls if not images.parse_url(url)]
+            originals = []
+            for url in external:
+                response = requests.get(url, timeout=30)
+                response.raise_for_status()
+                originals.append(response.content)
+            processed_urls = dict(zip(external, image_pipeline.ingest_many(originals)))
+        except (requests.RequestException, ImageError) as e:
+            print(f'{doc.id}: skipped ({e})')
+            continue
+        new_urls = [processed_urls.get(url, url) for url in urls]
+        doc.reference.update({'imageUrlList': new_urls, 'sourceImageUrlList': urls})
+        processed += 1
+        print(f'{doc.id}: {len(new_urls)} images')
+    image_pipeline.shutdown()
+    print(f'{processed} products updated')
+
+# With WARM_START=1, create_app() starts the catalog listeners and builds the
+# storefront in the background so the first request doesn't wait for them
+WARM_START = os.getenv('WARM_START') == '1'
+
+def warm_up():
+    # Create this process's client, start the catalog listeners and load the
+    # storefront. Call it after fork (e.g. from gunicorn's post_fork hook) when
+    # the app is preloaded.
+    def run():
+        try:
+            product_provider.start()
+            storefront.current()
+        except Exception as e:
+            app.logger.warning(f'Warm-up failed: {e}')
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def create_app():
+    # Entry point for WSGI servers, e.g. gunicorn 'app:create_app()'. Routes
+    # and hooks are registered at import, which starts no threads and opens
+    # no connections, so the module is safe to preload before forking.
+    if WARM_START:
+        warm_up()
+    startup.mark('app_created')
+    return app
+
+startup.mark('app_imported')
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True)
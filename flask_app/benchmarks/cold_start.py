@@ -0,0 +1,165 @@
+"""Cold-start benchmark: how long a fresh worker takes to serve its first request.
+
+Starts the app in a number of new processes, one after another, and records
+for each the time to import app.py, to run create_app(), to serve the first
+request and to serve the one after it, together with the phases the app
+records itself (provider.startup). Runs against the in-memory backend
+unless --backend says otherwise.
+
+    cd flask_app
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --runs 20 --warm
+    python benchmarks/cold_start.py --importtime         # slowest imports
+    python benchmarks/cold_start.py --baseline benchmarks/results/cold-start-<old>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from routes import APP_DIR, RESULTS_DIR, git_commit, peak_rss_mb, percentile
+
+STEPS = ('import', 'create_app', 'first_request', 'second_request', 'total')
+
+
+def run_once(path):
+    # Runs inside a fresh process
+    started = time.perf_counter()
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+
+    import app as store
+    imported = time.perf_counter()
+    app = store.create_app()
+    created = time.perf_counter()
+    client = app.test_client()
+    status = client.get(path).status_code
+    first = time.perf_counter()
+    client.get(path)
+    second = time.perf_counter()
+
+    from provider import startup
+    return {
+        'status': status,
+        'import': imported - started,
+        'create_app': created - imported,
+        'first_request': first - created,
+        'second_request': second - first,
+        'total': first - started,
+        'phases': startup.timings(),
+        'peak_rss_mb': peak_rss_mb(),
+        'modules': len(sys.modules),
+    }
+
+
+def slowest_imports(env, limit):
+    # Cumulative import time per module from python -X importtime
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                               cwd=APP_DIR, env=env, capture_output=True, text=True)
+    modules = []
+    for line in completed.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            modules.append((int(parts[1]), parts[2].strip()))
+    modules.sort(reverse=True)
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for us, name in modules[:limit]]
+
+
+def summarize(samples):
+    summary = {}
+    for step in STEPS:
+        values = sorted(s[step] * 1000 for s in samples)
+        summary[step] = {
+            'min_ms': round(values[0], 1),
+            'median_ms': round(percentile(values, 0.5), 1),
+            'p95_ms': round(percentile(values, 0.95), 1),
+        }
+    return summary
+
+
+def print_report(run, baseline=None):
+    header = f"{'step':<16}{'min ms':>10}{'median ms':>12}{'p95 ms':>10}"
+    if baseline:
+        header += f"{'median vs base':>16}"
+    print(header)
+    for step in STEPS:
+        s = run['summary'][step]
+        line = f"{step:<16}{s['min_ms']:>10.1f}{s['median_ms']:>12.1f}{s['p95_ms']:>10.1f}"
+        if baseline:
+            base = baseline.get('summary', {}).get(step)
+            if base and base.get('median_ms'):
+                line += f"{(s['median_ms'] / base['median_ms'] - 1) * 100:>+15.1f}%"
+            else:
+                line += f"{'-':>16}"
+        print(line)
+    if run.get('importtime'):
+        print('\nSlowest imports (cumulative):')
+        for entry in run['importtime']:
+            print(f"{entry['cumulative_ms']:>10.1f} ms  {entry['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how fast a new worker serves its first request.')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes to start')
+    parser.add_argument('--path', default='/', help='route requested after startup')
+    parser.add_argument('--backend', default='memory', help='DATA_BACKEND for the workers')
+    parser.add_argument('--warm', action='store_true', help='run with WARM_START=1')
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results file to compare median times against')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_once(args.path)))
+        return
+
+    env = dict(os.environ, DATA_BACKEND=args.backend, WARM_START='1' if args.warm else '0')
+    env.setdefault('TRACE_SAMPLE_RATE', '0')
+    env.setdefault('SECRET_KEY', 'benchmark')
+
+    samples = []
+    for i in range(args.runs):
+        print(f'Run {i + 1}/{args.runs}...', file=sys.stderr)
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--path', args.path],
+                                   env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit('Cold-start run failed')
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    run = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'warm_start': args.warm,
+        'path': args.path,
+        'summary': summarize(samples),
+        'samples': samples,
+    }
+    if args.importtime:
+        run['importtime'] = slowest_imports(env, 15)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"cold-start-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{run['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(run, baseline)
+    print(f'\nResults written to {output}')
+
+
+if __name__ == '__main__':
+    main()
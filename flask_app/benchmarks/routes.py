@@ -0,0 +1,336 @@
+"""Route benchmarks against the in-memory backend.
+
+Seeds a synthetic store (categories, vendors, products, buyers, carts,
+orders, reviews) at each requested scale, drives the main routes through
+the Flask test client and reports throughput, latency percentiles, peak RSS
+and Firestore reads per route. Every scale runs in its own process so
+memory figures do not bleed between runs.
+
+    cd flask_app
+    python benchmarks/routes.py                       # 1k, 10k and 100k products
+    python benchmarks/routes.py --scales 1000 --requests 50
+    python benchmarks/routes.py --baseline benchmarks/results/<old>.json
+    python benchmarks/routes.py --page-cache           # with the anonymous page cache on
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(APP_DIR, 'benchmarks', 'results')
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+CATEGORY_COUNT = 20
+VENDOR_COUNT = 50
+BUYER_COUNT = 200
+CART_LINES = 3
+REVIEWED_PRODUCTS = 50
+REVIEWS_PER_PRODUCT = 40
+
+WORDS = ('classic', 'running', 'leather', 'canvas', 'trail', 'urban', 'retro', 'slim',
+         'sport', 'winter', 'summer', 'light', 'pro', 'max', 'air', 'flex', 'cotton',
+         'denim', 'wool', 'street')
+NOUNS = ('sneakers', 'boots', 'sandals', 'jacket', 'hoodie', 'shirt', 'jeans', 'cap',
+         'backpack', 'socks', 'shorts', 'dress', 'loafers', 'watch', 'belt')
+BRANDS = ('Nike', 'Adidas', 'Puma', 'Reebok', 'Vans', 'Converse', 'Fila', 'Asics',
+          'Levis', 'Uniqlo')
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def generate_store(product_count, rng):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    categories = {f'cat{i:02d}': {'categoryName': f'Category {i:02d}', 'image': ''}
+                  for i in range(CATEGORY_COUNT)}
+    category_names = [c['categoryName'] for c in categories.values()]
+    vendors = {f'vendor{i:03d}': {'bussinessName': f'Vendor {i:03d}', 'email': f'vendor{i}@example.com',
+                                  'cityValue': 'Manila', 'stateValue': 'NCR', 'countryValue': 'PH'}
+               for i in range(VENDOR_COUNT)}
+    buyers = {f'buyer{i:04d}': {'email': f'buyer{i}@example.com', 'fullName': f'Buyer {i}',
+                                'phoneNumber': '0917', 'address': 'Somewhere', 'profileImage': ''}
+              for i in range(BUYER_COUNT)}
+
+    products = {}
+    for i in range(product_count):
+        name = f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {rng.choice(NOUNS).title()}'
+        products[f'prod{i:06d}'] = {
+            'productName': name,
+            'productDescription': f'{name} for everyday use.',
+            'productPrice': round(rng.uniform(5, 500), 2),
+            'brandName': rng.choice(BRANDS),
+            'category': rng.choice(category_names),
+            'vendorId': f'vendor{rng.randrange(VENDOR_COUNT):03d}',
+            'imageUrlList': [f'https://example.com/img/{i}.jpg'],
+            'sizeList': ['S', 'M', 'L'],
+            'quantity': rng.randrange(0, 200),
+            'rating': round(rng.uniform(0, 5), 1),
+            'reviewCount': rng.randrange(0, 500),
+            'is_featured': rng.random() < 0.01,
+            'chargeShipping': rng.random() < 0.5,
+            'shippingCharge': 5.0,
+            'createdAt': now - datetime.timedelta(seconds=i),
+            'updatedAt': now - datetime.timedelta(seconds=i),
+        }
+    product_ids = list(products)
+
+    collections = {
+        'categories': categories,
+        'vendors': vendors,
+        'buyers': buyers,
+        'products': products,
+        'userRoles': {**{uid: {'role': 'buyer', 'email': b['email']} for uid, b in buyers.items()},
+                      **{uid: {'role': 'vendor', 'email': v['email']} for uid, v in vendors.items()}},
+    }
+
+    orders = {}
+    for i in range(min(product_count // 10, 10000)):
+        product_id = rng.choice(product_ids)
+        product = products[product_id]
+        orders[f'order{i:06d}'] = {
+            'orderId': f'order{i:06d}',
+            'buyerId': f'buyer{rng.randrange(BUYER_COUNT):04d}',
+            'vendorId': product['vendorId'],
+            'products': [{'productId': product_id, 'productName': product['productName'],
+                          'price': product['productPrice'], 'quantity': 1,
+                          'imageUrl': product['imageUrlList'][0], 'vendorId': product['vendorId']}],
+            'totalAmount': product['productPrice'],
+            'status': rng.choice(('pending', 'processing', 'delivered', 'cancelled')),
+            'createdAt': now - datetime.timedelta(minutes=i),
+            'updatedAt': now - datetime.timedelta(minutes=i),
+        }
+    collections['orders'] = orders
+
+    for product_id in product_ids[:REVIEWED_PRODUCTS]:
+        collections[f'products/{product_id}/reviews'] = {
+            f'review{j:04d}': {'productId': product_id, 'userId': f'buyer{j % BUYER_COUNT:04d}',
+                               'userName': f'Buyer {j}', 'rating': rng.randint(1, 5),
+                               'comment': 'Nice.', 'createdAt': now - datetime.timedelta(hours=j)}
+            for j in range(REVIEWS_PER_PRODUCT)
+        }
+    return collections, product_ids
+
+
+def cart_lines(products, product_ids, rng):
+    lines = {}
+    for product_id in rng.sample(product_ids, CART_LINES):
+        product = products[product_id]
+        lines[product_id] = {'productId': product_id, 'productName': product['productName'],
+                             'productPrice': product['productPrice'], 'imageUrl': '',
+                             'quantity': 1, 'size': 'M', 'vendorId': product['vendorId']}
+    return lines
+
+
+def run_scale(product_count, requests_per_route, seed):
+    # Runs inside a fresh process; the backend has to be chosen before the
+    # app module is imported
+    os.environ['DATA_BACKEND'] = 'memory'
+    os.environ['METRICS_HEADERS'] = '1'
+    # Anonymous pages would otherwise be served from the page cache after the
+    # first request, timing cache hits rather than the views
+    os.environ.setdefault('PAGE_CACHE_SIZE', '0')
+    os.environ.setdefault('TRACE_SAMPLE_RATE', '0')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+
+    import app as store
+    from provider.category_counts import rebuild_category_counts
+    from provider.user_roles import remember_identity
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    collections, product_ids = generate_store(product_count, rng)
+    db = store.db
+    db.load(collections)
+    rebuild_category_counts(db)
+    seed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.product_provider.wait_until_loaded(timeout=300)
+    catalog_load_seconds = time.perf_counter() - started
+
+    products = collections['products']
+    buyer_ids = list(collections['buyers'])
+    in_stock = [pid for pid in product_ids if products[pid]['quantity'] > 10]
+    app = store.app
+    app.config['TESTING'] = True
+
+    def client_for(uid, role, email):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = uid
+            session['_fresh'] = True
+            remember_identity(session, uid, role, email)
+        return client
+
+    anonymous = app.test_client()
+    buyer_id = buyer_ids[0]
+    buyer = client_for(buyer_id, 'buyer', collections['buyers'][buyer_id]['email'])
+
+    def refill_cart():
+        for line in db.collection(f'users/{buyer_id}/cart').stream():
+            line.reference.delete()
+        db.load({f'users/{buyer_id}/cart': cart_lines(products, in_stock, rng)})
+
+    category_ids = list(collections['categories'])
+    routes = [
+        ('home', lambda: anonymous.get('/'), None),
+        ('all_products', lambda: anonymous.get('/products'), None),
+        ('all_products_price_low', lambda: anonymous.get('/products?sort=price_low'), None),
+        ('products_page', lambda: anonymous.get('/api/products/page?view=grid'), None),
+        ('category_products', lambda: anonymous.get(f'/category/{rng.choice(category_ids)}'), None),
+        ('search', lambda: anonymous.get(f'/search?q={rng.choice(WORDS)}+{rng.choice(NOUNS)}'), None),
+        ('product_details', lambda: anonymous.get(f'/product/{rng.choice(product_ids)}'), None),
+        ('product_details_reviewed', lambda: anonymous.get(f'/product/{rng.choice(product_ids[:REVIEWED_PRODUCTS])}'), None),
+        ('cart', lambda: buyer.get('/cart'), refill_cart),
+        ('checkout', lambda: buyer.get('/checkout'), refill_cart),
+        ('place_order', lambda: buyer.post('/place_order', data={'fullName': 'Buyer', 'phoneNumber': '0917',
+                                                                 'address': 'Somewhere'}), refill_cart),
+        ('orders', lambda: buyer.get('/orders'), None),
+    ]
+
+    results = {}
+    for name, call, setup in routes:
+        # One untimed warm-up call (template compilation, caches)
+        if setup:
+            setup()
+        call()
+        latencies, reads, round_trips, errors = [], [], [], 0
+        elapsed = 0.0
+        for _ in range(requests_per_route):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            response = call()
+            duration = time.perf_counter() - t0
+            elapsed += duration
+            latencies.append(duration * 1000)
+            if response.status_code >= 400:
+                errors += 1
+            reads.append(int(response.headers.get('X-Firestore-Reads', 0)))
+            round_trips.append(int(response.headers.get('X-Firestore-Round-Trips', 0)))
+        latencies.sort()
+        results[name] = {
+            'requests': requests_per_route,
+            'errors': errors,
+            'throughput_rps': round(requests_per_route / elapsed, 1) if elapsed else None,
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'reads_per_request': round(sum(reads) / len(reads), 1),
+            'round_trips_per_request': round(sum(round_trips) / len(round_trips), 1),
+        }
+
+    return {
+        'products': product_count,
+        'seed_seconds': round(seed_seconds, 2),
+        'catalog_load_seconds': round(catalog_load_seconds, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'routes': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(run, baseline=None):
+    for scale, result in run['scales'].items():
+        print(f"\n{int(scale):,} products  (seed {result['seed_seconds']}s, catalog load "
+              f"{result['catalog_load_seconds']}s, peak RSS {result['peak_rss_mb']} MB)")
+        print(f"  {'route':<26}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'reads':>8}{'trips':>7}"
+              + (f"{'p95 vs base':>13}" if baseline else ''))
+        base_routes = ((baseline or {}).get('scales', {}).get(scale) or {}).get('routes', {})
+        for name, r in result['routes'].items():
+            line = (f"  {name:<26}{r['throughput_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+                    f"{r['reads_per_request']:>8}{r['round_trips_per_request']:>7}")
+            if baseline:
+                base = base_routes.get(name)
+                if base and base.get('p95_ms'):
+                    line += f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+                else:
+                    line += f"{'-':>13}"
+            if r['errors']:
+                line += f"  ({r['errors']} errors)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main routes on synthetic catalogs.')
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help='comma-separated product counts (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per route')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results file to compare p95 latency against')
+    parser.add_argument('--page-cache', action='store_true',
+                        help='leave the anonymous page cache on (timings are then mostly cache hits)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_scale(args.worker, args.requests, args.seed)))
+        return
+
+    if args.page_cache:
+        os.environ.setdefault('PAGE_CACHE_SIZE', '256')
+    run = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'requests_per_route': args.requests,
+        'page_cache': args.page_cache,
+        'seed': args.seed,
+        'scales': {},
+    }
+    for scale in (int(s) for s in args.scales.split(',') if s.strip()):
+        print(f'Running {scale:,} products...', file=sys.stderr)
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(scale),
+                                    '--requests', str(args.requests), '--seed', str(args.seed)],
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(f'Benchmark for {scale} products failed')
+        run['scales'][str(scale)] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{run['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(run, baseline)
+    print(f'\nResults written to {output}')
+
+
+if __name__ == '__main__':
+    main()
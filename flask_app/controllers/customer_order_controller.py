@@ -0,0 +1,123 @@
+from google.cloud import firestore
+from provider.datastore import transactional
+from models import Product
+from controllers.vendor_order_controller import record_order_created
+
+# Commit attempts before giving up when concurrent checkouts keep touching
+# the same products
+MAX_ATTEMPTS = 5
+
+
+class OrderError(Exception):
+    pass
+
+
+class EmptyOrderError(OrderError):
+    pass
+
+
+class OutOfStockError(OrderError):
+    def __init__(self, product_names):
+        super().__init__('Not enough stock for: ' + ', '.join(product_names))
+        self.product_names = product_names
+
+
+class OrderContentionError(OrderError):
+    pass
+
+
+def place_order(db, buyer_id, full_name, phone_number, shipping_address, payment_method):
+    # Create the order, decrement stock for every line, update the vendor's
+    # sales rollup and clear the cart in one transaction. Returns the new
+    # order id.
+    transaction = db.transaction(max_attempts=MAX_ATTEMPTS)
+    try:
+        return _place_order(transaction, db, buyer_id, full_name, phone_number,
+                            shipping_address, payment_method)
+    except ValueError as e:
+        # The client raises ValueError once every attempt has been aborted
+        if 'attempts' in str(e):
+            raise OrderContentionError('The store is busy right now, please try again') from e
+        raise
+
+
+@transactional
+def _place_order(transaction, db, buyer_id, full_name, phone_number,
+                 shipping_address, payment_method):
+    # All reads first: the cart, then every product in one batch
+    cart_ref = db.collection('users').document(buyer_id).collection('cart')
+    cart_items = list(cart_ref.stream(transaction=transaction))
+    cart_data = [item.to_dict() for item in cart_items]
+
+    product_refs = {}
+    for item_data in cart_data:
+        product_refs.setdefault(item_data['productId'], db.collection('products').document(item_data['productId']))
+    products_by_id = {doc.id: Product.from_snapshot(doc)
+                      for doc in transaction.get_all(list(product_refs.values()))
+                      if doc.exists}
+
+    products = []
+    total_amount = 0
+    vendor_id = None
+    ordered = {}
+    for item_data in cart_data:
+        product = products_by_id.get(item_data['productId'])
+        if product is None:
+            continue
+        quantity = item_data.get('quantity', 1)
+        total_amount += product.price * quantity
+        ordered[item_data['productId']] = ordered.get(item_data['productId'], 0) + quantity
+
+        # Get vendor ID from the first product
+        if vendor_id is None:
+            vendor_id = product.vendor_id
+
+        products.append({
+            'productId': item_data['productId'],
+            'productName': product.name,
+            'price': product.price,
+            'quantity': quantity,
+            'size': item_data.get('size'),
+            'imageUrl': product.images[0] if product.images else '',
+            'vendorId': product.vendor_id
+        })
+
+    if not vendor_id:
+        raise EmptyOrderError('No valid vendor found for the products')
+
+    out_of_stock = [products_by_id[product_id].name or product_id
+                    for product_id, quantity in ordered.items()
+                    if products_by_id[product_id].stock < quantity]
+    if out_of_stock:
+        raise OutOfStockError(out_of_stock)
+
+    # Then every write, committed together
+    order_ref = db.collection('orders').document()
+    order_data = {
+        'orderId': order_ref.id,
+        'buyerId': buyer_id,
+        'vendorId': vendor_id,
+        'vendorIds': sorted({line['vendorId'] for line in products if line['vendorId']}),
+        'buyerName': full_name,
+        'buyerPhone': phone_number,
+        'shippingAddress': shipping_address,
+        'paymentMethod': payment_method,
+        'products': products,
+        'totalAmount': total_amount,
+        'status': 'pending',
+        'createdAt': firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+    transaction.set(order_ref, order_data)
+    record_order_created(db, transaction, order_data)
+
+    for product_id, quantity in ordered.items():
+        transaction.update(product_refs[product_id], {
+            'quantity': products_by_id[product_id].stock - quantity,
+            'updatedAt': firestore.SERVER_TIMESTAMP
+        })
+
+    for item in cart_items:
+        transaction.delete(item.reference)
+
+    return order_ref.id
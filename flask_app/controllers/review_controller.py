@@ -0,0 +1,155 @@
+from google.cloud import firestore
+from models import Review
+from provider.datastore import transactional
+from provider.pagination import fetch_page
+
+# Reviews shown on the product page, and per "load more" request
+REVIEWS_PAGE_SIZE = 10
+
+MAX_COMMENT_LENGTH = 2000
+
+MAX_ATTEMPTS = 5
+
+STARS = ('1', '2', '3', '4', '5')
+
+# Rating aggregates kept on the product document, updated in the same
+# transaction as every review write:
+#   ratingSum, reviewCount, ratingHistogram {'1'..'5': n} and rating (the average)
+
+
+class ReviewError(Exception):
+    pass
+
+
+class InvalidReviewError(ReviewError):
+    pass
+
+
+class ProductNotFoundError(ReviewError):
+    pass
+
+
+class ReviewContentionError(ReviewError):
+    pass
+
+
+def reviews_ref(db, product_id):
+    return db.collection('products').document(product_id).collection('reviews')
+
+
+def reviews_page(db, product_id, cursor=None, page_size=REVIEWS_PAGE_SIZE, timeout=None):
+    # Newest first; returns (reviews, next_cursor). Only one page is read, so
+    # a product with thousands of reviews costs the same as one with ten.
+    query = reviews_ref(db, product_id).order_by('createdAt', direction=firestore.Query.DESCENDING)
+    docs, next_cursor = fetch_page(query, ['createdAt'], cursor=cursor,
+                                   direction=firestore.Query.DESCENDING, page_size=page_size, timeout=timeout)
+    return [Review.from_snapshot(doc) for doc in docs], next_cursor
+
+
+def has_purchased(db, user_id, product_id):
+    # Verified purchase: the product is on one of the buyer's delivered orders
+    orders = (db.collection('orders')
+              .where('buyerId', '==', user_id)
+              .where('status', '==', 'delivered')
+              .select(['products'])
+              .stream())
+    return any(item.get('productId') == product_id
+               for order in orders
+               for item in (order.to_dict() or {}).get('products', []))
+
+
+def submit_review(db, product_id, user_id, rating, comment, user_name='', user_image=''):
+    # Create or replace the user's review of a product and update the
+    # product's rating aggregates atomically. A user has at most one review
+    # per product (the review id is the user id).
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        rating = 0
+    if str(rating) not in STARS:
+        raise InvalidReviewError('Please choose a rating from 1 to 5 stars')
+    comment = (comment or '').strip()[:MAX_COMMENT_LENGTH]
+
+    verified = has_purchased(db, user_id, product_id)
+    transaction = db.transaction(max_attempts=MAX_ATTEMPTS)
+    try:
+        _submit_review(transaction, db, product_id, user_id, rating, comment,
+                       user_name, user_image, verified)
+    except ValueError as e:
+        # The client raises ValueError once every attempt has been aborted
+        if 'attempts' in str(e):
+            raise ReviewContentionError('Could not save your review right now, please try again') from e
+        raise
+
+
+@transactional
+def _submit_review(transaction, db, product_id, user_id, rating, comment,
+                   user_name, user_image, verified):
+    product_ref = db.collection('products').document(product_id)
+    review_ref = reviews_ref(db, product_id).document(user_id)
+    docs = {doc.reference.path: doc for doc in transaction.get_all([product_ref, review_ref])}
+    product_doc, review_doc = docs.get(product_ref.path), docs.get(review_ref.path)
+    if product_doc is None or not product_doc.exists:
+        raise ProductNotFoundError('Product not found')
+
+    product_data = product_doc.to_dict()
+    if 'ratingSum' in product_data:
+        stats = {
+            'ratingSum': product_data.get('ratingSum', 0),
+            'reviewCount': product_data.get('reviewCount', 0),
+            'ratingHistogram': {star: product_data.get('ratingHistogram', {}).get(star, 0) for star in STARS},
+        }
+    else:
+        # First review since aggregates were introduced: count what is there
+        stats = _aggregate(reviews_ref(db, product_id), transaction=transaction)
+
+    previous = review_doc.to_dict() if review_doc is not None and review_doc.exists else None
+    if previous is not None:
+        _add_rating(stats, previous.get('rating', 0), -1)
+    _add_rating(stats, rating, 1)
+
+    transaction.set(review_ref, {
+        'productId': product_id,
+        'userId': user_id,
+        'userName': user_name or 'Anonymous',
+        'userImage': user_image or '',
+        'rating': rating,
+        'comment': comment,
+        'isVerifiedPurchase': verified,
+        'createdAt': previous.get('createdAt') if previous else firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    })
+    transaction.update(product_ref, _with_average(stats))
+
+
+def _add_rating(stats, rating, sign):
+    star = str(int(rating or 0))
+    if star not in STARS:
+        return
+    stats['ratingSum'] += sign * int(star)
+    stats['reviewCount'] += sign
+    stats['ratingHistogram'][star] = stats['ratingHistogram'].get(star, 0) + sign
+
+
+def _with_average(stats):
+    count = stats['reviewCount']
+    return {**stats, 'rating': round(stats['ratingSum'] / count, 2) if count else 0.0}
+
+
+def _aggregate(reviews, transaction=None):
+    # One count aggregation per star; ratingSum follows from the histogram
+    histogram = {star: int(reviews.where('rating', '==', int(star)).count()
+                           .get(transaction=transaction)[0][0].value)
+                 for star in STARS}
+    return {
+        'ratingSum': sum(int(star) * n for star, n in histogram.items()),
+        'reviewCount': sum(histogram.values()),
+        'ratingHistogram': histogram,
+    }
+
+
+def rebuild_review_stats(db, product_id):
+    # Recompute a product's rating aggregates from its reviews
+    stats = _with_average(_aggregate(reviews_ref(db, product_id)))
+    db.collection('products').document(product_id).update(stats)
+    return stats
@@ -0,0 +1,165 @@
+import datetime
+import heapq
+import os
+from google.cloud import firestore
+from provider import tasks
+from provider.datastore import rpc_deadline, transactional
+from provider.documents import get_document
+from provider.ttl_cache import TTLCache
+
+# Per-vendor rollup, updated in the same commit as every order write here:
+#   vendorStats/<vendorId> = {'totalSales', 'totalOrders', 'pendingOrders',
+#                             'complete', 'rebuiltAt', 'updatedAt'}
+# The increments create the document if it is missing; only a full rebuild
+# sets `complete`, and until then the rollup is recomputed from the orders.
+# A vendor is credited only for its own lines of an order.
+STATS_COLLECTION = 'vendorStats'
+
+# The Flutter app writes orders without updating the rollup, so a complete
+# rollup is only trusted for this many seconds after its last rebuild; an
+# older one is still shown while it is rebuilt from the orders
+STATS_MAX_AGE = float(os.getenv('VENDOR_STATS_MAX_AGE', 600))
+
+# Vendors this process has enqueued a rebuild for lately, so a busy
+# dashboard does not queue one per page view
+_rebuilding = TTLCache(maxsize=4096, ttl=60)
+
+# Orders in these states do not count towards a vendor's sales
+NON_SALE_STATUSES = ('cancelled', 'refunded')
+
+
+def stats_ref(db, vendor_id):
+    return db.collection(STATS_COLLECTION).document(vendor_id)
+
+
+def _status_contribution(status, amount):
+    return {
+        'totalSales': 0 if status in NON_SALE_STATUSES else amount,
+        'pendingOrders': 1 if status == 'pending' else 0,
+    }
+
+
+def _apply(db, writer, vendor_id, deltas):
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not vendor_id or not deltas:
+        return
+    data = {field: firestore.Increment(value) for field, value in deltas.items()}
+    data['updatedAt'] = firestore.SERVER_TIMESTAMP
+    writer.set(stats_ref(db, vendor_id), data, merge=True)
+
+
+def vendor_amounts(order_data):
+    # {vendor_id: that vendor's share of the order}; lines without a vendor
+    # (older orders) belong to the order's vendor
+    amounts = {}
+    for line in order_data.get('products') or []:
+        vendor_id = line.get('vendorId') or order_data.get('vendorId')
+        if vendor_id:
+            amounts[vendor_id] = amounts.get(vendor_id, 0) + (line.get('price') or 0) * (line.get('quantity') or 1)
+    if not amounts and order_data.get('vendorId'):
+        amounts[order_data['vendorId']] = order_data.get('totalAmount', 0)
+    return amounts
+
+
+def record_order_created(db, writer, order_data):
+    # `writer` is the transaction or batch that also writes the order
+    for vendor_id, amount in vendor_amounts(order_data).items():
+        contribution = _status_contribution(order_data.get('status'), amount)
+        _apply(db, writer, vendor_id, {'totalOrders': 1, **contribution})
+
+
+def record_status_change(db, writer, order_data, new_status):
+    # `order_data` is the order as it was before the status change
+    for vendor_id, amount in vendor_amounts(order_data).items():
+        before = _status_contribution(order_data.get('status'), amount)
+        after = _status_contribution(new_status, amount)
+        _apply(db, writer, vendor_id, {field: after[field] - before[field] for field in after})
+
+
+def _age(stats):
+    rebuilt_at = stats.get('rebuiltAt')
+    if not isinstance(rebuilt_at, datetime.datetime):
+        return float('inf')
+    return (datetime.datetime.now(datetime.timezone.utc) - rebuilt_at).total_seconds()
+
+
+def _schedule_rebuild(db, vendor_id):
+    if _rebuilding.get(vendor_id):
+        return
+    _rebuilding.set(vendor_id, True)
+    tasks.enqueue(db, 'vendor_stats.rebuild', vendor_id)
+
+
+def get_vendor_stats(db, vendor_id):
+    doc = get_document(stats_ref(db, vendor_id))
+    stats = doc.to_dict() if doc.exists else {}
+    if stats.get('complete') is not True:
+        # Answer from the orders now; storing the rollup can happen later
+        _schedule_rebuild(db, vendor_id)
+        return compute_vendor_stats(db, vendor_id)
+    if _age(stats) > STATS_MAX_AGE:
+        _schedule_rebuild(db, vendor_id)
+    return stats
+
+
+def _vendor_order_queries(db, vendor_id):
+    # Orders the vendor is the order vendor of, and those holding any of its
+    # lines (vendorIds)
+    return (db.collection('orders').where('vendorId', '==', vendor_id),
+            db.collection('orders').where('vendorIds', 'array_contains', vendor_id))
+
+
+def compute_vendor_stats(db, vendor_id, transaction=None):
+    # The rollup recomputed from the vendor's orders
+    orders = {}
+    for query in _vendor_order_queries(db, vendor_id):
+        for doc in query.select(['vendorId', 'status', 'products', 'totalAmount']).stream(transaction=transaction):
+            orders[doc.id] = doc.to_dict()
+
+    stats = {'totalOrders': 0, 'pendingOrders': 0, 'totalSales': 0}
+    for order_data in orders.values():
+        amount = vendor_amounts(order_data).get(vendor_id)
+        if amount is None:
+            continue
+        stats['totalOrders'] += 1
+        for field, value in _status_contribution(order_data.get('status'), amount).items():
+            stats[field] += value
+    return stats
+
+
+@transactional
+def _rebuild_vendor_stats(transaction, db, vendor_id):
+    # Reading the rollup in the transaction makes an order commit that
+    # increments it meanwhile conflict with this rebuild, which then retries
+    ref = stats_ref(db, vendor_id)
+    list(transaction.get_all([ref]))
+    stats = compute_vendor_stats(db, vendor_id, transaction=transaction)
+    transaction.set(ref, {**stats, 'complete': True, 'rebuiltAt': firestore.SERVER_TIMESTAMP,
+                          'updatedAt': firestore.SERVER_TIMESTAMP})
+    return stats
+
+
+@tasks.task('vendor_stats.rebuild')
+def rebuild_vendor_stats(db, vendor_id):
+    try:
+        return _rebuild_vendor_stats(db.transaction(), db, vendor_id)
+    finally:
+        _rebuilding.pop(vendor_id)
+
+
+def recent_orders(db, vendor_id, limit=5, timeout=None):
+    # Needs the composite indexes orders(vendorId ASC, createdAt DESC) and
+    # orders(vendorIds ARRAY_CONTAINS, createdAt DESC)
+    orders = {}
+    for query in _vendor_order_queries(db, vendor_id):
+        for doc in query.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit).stream(
+                **rpc_deadline(timeout)):
+            orders[doc.id] = doc
+    return heapq.nlargest(limit, orders.values(), key=_created_at)
+
+
+def _created_at(doc):
+    created_at = (doc.to_dict() or {}).get('createdAt')
+    if isinstance(created_at, datetime.datetime):
+        return created_at
+    return datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
@@ -1,6 +1,3 @@
-from datetime import datetime
-from firebase_admin import firestore
-
 class Category:
     def __init__(self, id, name, image_url, description):
         self.id = id
@@ -26,89 +23,164 @@ class Category:
         }
 
 class Product:
-    def __init__(self, id, name, description, price, category_id, vendor_id, 
-                 images, stock, created_at=None, updated_at=None):
+    __slots__ = ('id', 'name', 'description', 'price', 'brand', 'category', 'vendor_id',
+                 'images', 'sizes', 'stock', 'rating', 'review_count', 'rating_histogram',
+                 'is_featured',
+                 'charge_shipping', 'shipping_charge', 'schedule_date',
+                 'created_at', 'updated_at')
+
+    # Firestore fields a product card needs; pass to Query.select() so
+    # listing queries only transfer these
+    LISTING_FIELDS = ['productName', 'productPrice', 'brandName', 'imageUrlList',
+                      'rating', 'reviewCount', 'category', 'quantity']
+
+    def __init__(self, id, name='', description='', price=0.0, brand='', category='',
+                 vendor_id=None, images=None, sizes=None, stock=0, rating=0.0,
+                 review_count=0, rating_histogram=None, is_featured=False, charge_shipping=False,
+                 shipping_charge=0.0, schedule_date=None, created_at=None, updated_at=None):
         self.id = id
         self.name = name
         self.description = description
         self.price = price
-        self.category_id = category_id
+        self.brand = brand
+        self.category = category
         self.vendor_id = vendor_id
-        self.images = images
+        self.images = images if images is not None else []
+        self.sizes = sizes if sizes is not None else []
         self.stock = stock
-        self.created_at = created_at or datetime.now()
-        self.updated_at = updated_at or datetime.now()
+        self.rating = rating
+        self.review_count = review_count
+        self.rating_histogram = rating_histogram if rating_histogram is not None else {}
+        self.is_featured = is_featured
+        self.charge_shipping = charge_shipping
+        self.shipping_charge = shipping_charge
+        self.schedule_date = schedule_date
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls.from_dict(snapshot.to_dict() or {}, id=snapshot.id)
 
     @classmethod
     def from_dict(cls, data, id=None):
         return cls(
-            id=id or data.get('id'),
-            name=data.get('name'),
-            description=data.get('description'),
-            price=data.get('price'),
-            category_id=data.get('categoryId'),
+            id=id or data.get('productId'),
+            name=data.get('productName') or '',
+            description=data.get('productDescription') or '',
+            price=data.get('productPrice') or 0.0,
+            brand=data.get('brandName') or '',
+            category=data.get('category') or '',
             vendor_id=data.get('vendorId'),
-            images=data.get('images', []),
-            stock=data.get('stock', 0),
+            images=data.get('imageUrlList') or [],
+            sizes=data.get('sizeList') or [],
+            stock=data.get('quantity') or 0,
+            rating=data.get('rating') or 0.0,
+            review_count=data.get('reviewCount') or 0,
+            rating_histogram=data.get('ratingHistogram') or {},
+            is_featured=data.get('is_featured') is True,
+            charge_shipping=data.get('chargeShipping') or False,
+            shipping_charge=data.get('shippingCharge') or 0.0,
+            schedule_date=data.get('scheduleDate'),
             created_at=data.get('createdAt'),
             updated_at=data.get('updatedAt')
         )
 
     def to_dict(self):
         return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'price': self.price,
-            'categoryId': self.category_id,
+            'productId': self.id,
+            'productName': self.name,
+            'productDescription': self.description,
+            'productPrice': self.price,
+            'brandName': self.brand,
+            'category': self.category,
             'vendorId': self.vendor_id,
-            'images': self.images,
-            'stock': self.stock,
+            'imageUrlList': self.images,
+            'sizeList': self.sizes,
+            'quantity': self.stock,
+            'rating': self.rating,
+            'reviewCount': self.review_count,
+            'ratingHistogram': self.rating_histogram,
+            'is_featured': self.is_featured,
+            'chargeShipping': self.charge_shipping,
+            'shippingCharge': self.shipping_charge,
+            'scheduleDate': self.schedule_date,
             'createdAt': self.created_at,
             'updatedAt': self.updated_at
         }
 
 class Order:
-    def __init__(self, id, buyer_id, vendor_id, products, total_amount,
-                 shipping_address, payment_method, status, created_at=None):
+    __slots__ = ('id', 'buyer_id', 'buyer_name', 'buyer_phone', 'vendor_id', 'courier_id',
+                 'courier_name', 'products', 'total_amount', 'shipping_address',
+                 'payment_method', 'status', 'created_at', 'picked_up_at', 'updated_at')
+
+    def __init__(self, id, buyer_id='', vendor_id='', products=None, total_amount=0.0,
+                 shipping_address='', payment_method='', status='', created_at=None,
+                 buyer_name='', buyer_phone='', courier_id='', courier_name='',
+                 picked_up_at=None, updated_at=None):
         self.id = id
         self.buyer_id = buyer_id
+        self.buyer_name = buyer_name
+        self.buyer_phone = buyer_phone
         self.vendor_id = vendor_id
-        self.products = products
+        self.courier_id = courier_id
+        self.courier_name = courier_name
+        self.products = products if products is not None else []
         self.total_amount = total_amount
         self.shipping_address = shipping_address
         self.payment_method = payment_method
         self.status = status
-        self.created_at = created_at or datetime.now()
+        self.created_at = created_at
+        self.picked_up_at = picked_up_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls.from_dict(snapshot.to_dict() or {}, id=snapshot.id)
 
     @classmethod
     def from_dict(cls, data, id=None):
         return cls(
-            id=id or data.get('id'),
-            buyer_id=data.get('buyerId'),
-            vendor_id=data.get('vendorId'),
+            id=id or str(data.get('orderId', '')),
+            buyer_id=str(data.get('buyerId', '')),
+            buyer_name=str(data.get('buyerName', '')),
+            buyer_phone=str(data.get('buyerPhone', '')),
+            vendor_id=str(data.get('vendorId', '')),
+            courier_id=str(data.get('courierId', '')),
+            courier_name=str(data.get('courierName', '')),
             products=data.get('products', []),
-            total_amount=data.get('totalAmount'),
-            shipping_address=data.get('shippingAddress'),
-            payment_method=data.get('paymentMethod'),
-            status=data.get('status'),
-            created_at=data.get('createdAt')
+            total_amount=float(data.get('totalAmount') or 0),
+            shipping_address=str(data.get('shippingAddress', '')),
+            payment_method=str(data.get('paymentMethod', '')),
+            status=str(data.get('status', '')),
+            created_at=data.get('createdAt'),
+            picked_up_at=data.get('pickedUpAt'),
+            updated_at=data.get('updatedAt')
         )
 
     def to_dict(self):
         return {
-            'id': self.id,
+            'orderId': self.id,
             'buyerId': self.buyer_id,
+            'buyerName': self.buyer_name,
+            'buyerPhone': self.buyer_phone,
             'vendorId': self.vendor_id,
+            'courierId': self.courier_id,
+            'courierName': self.courier_name,
             'products': self.products,
             'totalAmount': self.total_amount,
             'shippingAddress': self.shipping_address,
             'paymentMethod': self.payment_method,
             'status': self.status,
-            'createdAt': self.created_at
+            'createdAt': self.created_at,
+            'pickedUpAt': self.picked_up_at,
+            'updatedAt': self.updated_at
         }
 
 class Review:
+    __slots__ = ('id', 'product_id', 'user_id', 'user_name', 'user_image', 'rating',
+                 'comment', 'created_at', 'is_verified_purchase')
+
     def __init__(self, id, product_id, user_id, user_name, user_image,
                  rating, comment, created_at, is_verified_purchase=False):
         self.id = id
@@ -121,16 +193,20 @@ class Review:
         self.created_at = created_at
         self.is_verified_purchase = is_verified_purchase
 
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls.from_dict(snapshot.to_dict() or {}, id=snapshot.id)
+
     @classmethod
     def from_dict(cls, data, id=None):
         return cls(
             id=id or data.get('id'),
             product_id=data.get('productId'),
             user_id=data.get('userId'),
-            user_name=data.get('userName'),
-            user_image=data.get('userImage'),
-            rating=data.get('rating'),
-            comment=data.get('comment'),
+            user_name=data.get('userName') or 'Anonymous',
+            user_image=data.get('userImage') or '',
+            rating=data.get('rating') or 0,
+            comment=data.get('comment') or '',
             created_at=data.get('createdAt'),
             is_verified_purchase=data.get('isVerifiedPurchase', False)
         )
@@ -146,4 +222,4 @@ class Review:
             'comment': self.comment,
             'createdAt': self.created_at,
             'isVerifiedPurchase': self.is_verified_purchase
-        } 
\ No newline at end of file
+        }
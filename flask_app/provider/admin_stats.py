@@ -0,0 +1,65 @@
+from provider.pagination import PAGE_SIZE, encode_cursor, decode_cursor, fetch_page
+
+USER_COLLECTIONS = ('buyers', 'vendors', 'couriers')
+
+# Orders in these states never turned into money
+NON_REVENUE_STATUSES = ['cancelled', 'refunded']
+
+
+def count(query):
+    # Server-side count aggregation: one read per batch of up to 1000 matches
+    # instead of downloading every document
+    return int(query.count().get()[0][0].value)
+
+
+def total(query, field):
+    value = query.sum(field).get()[0][0].value
+    return value or 0
+
+
+def dashboard_totals(db):
+    orders = db.collection('orders')
+    return {
+        'total_users': count(db.collection('buyers')),
+        'total_vendors': count(db.collection('vendors')),
+        'total_orders': count(orders),
+        'total_revenue': total(orders.where('status', 'not-in', NON_REVENUE_STATUSES), 'totalAmount'),
+    }
+
+
+def _user_row(collection, doc):
+    user_data = doc.to_dict()
+    return {
+        'id': doc.id,
+        'name': user_data.get('fullName', 'N/A'),
+        'email': user_data.get('email', 'N/A'),
+        'role': collection[:-1],  # Remove 's' from end
+        'is_active': user_data.get('status', 'active') == 'active',
+        'created_at': user_data.get('createdAt', None)
+    }
+
+
+def fetch_users_page(db, role_filter='all', cursor=None, page_size=PAGE_SIZE):
+    # One page of users from one role collection, or from all of them one
+    # after another. The cursor remembers the collection it stopped in.
+    # Returns (users, next_cursor).
+    collections = USER_COLLECTIONS if role_filter == 'all' else (role_filter,)
+
+    start_collection, inner_cursor = collections[0], None
+    position = decode_cursor(cursor)
+    if position is not None and position[0] and position[0][0] in collections:
+        start_collection = position[0][0]
+        # An empty id means "from the start of this collection"
+        inner_cursor = encode_cursor([], position[1]) if position[1] else None
+
+    users = []
+    for collection in collections[collections.index(start_collection):]:
+        remaining = page_size - len(users)
+        if remaining == 0:
+            return users, encode_cursor([collection], '')
+        docs, next_inner = fetch_page(db.collection(collection), [], cursor=inner_cursor, page_size=remaining)
+        users.extend(_user_row(collection, doc) for doc in docs)
+        inner_cursor = None
+        if next_inner is not None:
+            return users, encode_cursor([collection], docs[-1].id)
+    return users, None
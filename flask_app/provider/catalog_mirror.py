@@ -0,0 +1,201 @@
+import datetime
+import math
+import os
+import sqlite3
+import threading
+from provider.pagination import PAGE_SIZE, decode_cursor, encode_cursor
+
+# SQLite database holding the mirror. Every process keeps its own copy (a
+# file path gets the pid appended) and refills it from the catalog listener
+# on start, so nothing in it needs to survive a restart.
+MIRROR_PATH = os.getenv('CATALOG_MIRROR_PATH', ':memory:')
+
+# The /products price filter values, as inclusive (min, max) bounds
+PRICE_RANGES = {
+    '0-25': (None, 25),
+    '25-50': (25, 50),
+    '50-100': (50, 100),
+    '100+': (100, None),
+}
+
+# sort name -> (column, direction); ties are broken by id in the same
+# direction, as the Firestore listing does
+SORTS = {
+    'newest': ('created_at', 'DESC'),
+    'price_low': ('price', 'ASC'),
+    'price_high': ('price', 'DESC'),
+    'rating': ('rating', 'DESC'),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    vendor_id TEXT,
+    price REAL NOT NULL,
+    rating REAL NOT NULL,
+    review_count INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    is_featured INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_created ON products (created_at, id);
+CREATE INDEX IF NOT EXISTS products_price ON products (price, id);
+CREATE INDEX IF NOT EXISTS products_rating ON products (rating, id);
+CREATE INDEX IF NOT EXISTS products_category_created ON products (category, created_at, id);
+CREATE INDEX IF NOT EXISTS products_category_price ON products (category, price, id);
+CREATE INDEX IF NOT EXISTS products_category_rating ON products (category, rating, id);
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+'''
+
+
+def price_bounds(price_range):
+    # (min_price, max_price) for a /products price_range value; unknown values are unbounded
+    return PRICE_RANGES.get(price_range, (None, None))
+
+
+def rating_bound(min_rating):
+    # Minimum rating for a /products rating value; empty or malformed values don't filter
+    try:
+        value = float(min_rating) if min_rating else None
+    except (TypeError, ValueError):
+        return None
+    return value if value is None or math.isfinite(value) else None
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return 0.0
+
+
+def _row(product):
+    return (product.id, product.category or '', product.brand or '', product.vendor_id,
+            float(product.price or 0), float(product.rating or 0), int(product.review_count or 0),
+            int(product.stock or 0), int(bool(product.is_featured)), _timestamp(product.created_at))
+
+
+class CatalogMirror:
+    """Indexed SQLite copy of the product and category fields used to filter and sort.
+
+    Register ``on_product_change`` and ``on_category_change`` with the
+    ProductProvider before it starts; the mirror is complete while it is
+    ``ready`` and the provider is ``available``. Firestore stays the source of truth: the mirror only
+    answers which product ids match, in what order, and how many there are,
+    so any combination of filters works without a composite index.
+    """
+
+    def __init__(self, catalog, path=MIRROR_PATH):
+        self.catalog = catalog
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._categories_stale = True
+        self._filled = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        # True once this process's copy has been filled from the start of a
+        # catalog load; it is then complete whenever the provider is available
+        return self._filled and self._pid == os.getpid()
+
+    def _connection(self):
+        # One connection per process, opened on first use; the caller holds the lock
+        if self._conn is None or self._pid != os.getpid():
+            path = self.path if self.path == ':memory:' else f'{self.path}.{os.getpid()}'
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+            self._categories_stale = True
+            self._filled = False
+        return self._conn
+
+    def _read(self):
+        # Writes from the listener are committed in batches, when next read
+        conn = self._connection()
+        if conn.in_transaction:
+            conn.commit()
+        return conn
+
+    # Change tracking
+
+    def on_product_change(self, change_type, product_id, old, new):
+        with self._lock:
+            conn = self._connection()
+            if change_type == 'RESET':
+                conn.execute('DELETE FROM products')
+                self._filled = True
+            elif new is None:
+                conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            else:
+                conn.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', _row(new))
+
+    def on_category_change(self):
+        # Runs under the provider's lock, mid-load perhaps; copied in on next lookup
+        self._categories_stale = True
+
+    def _refresh_categories(self):
+        # Outside our lock: the provider calls us while holding its own
+        self._categories_stale = False
+        categories = [(c['id'], c.get('categoryName', '')) for c in self.catalog.categories()]
+        with self._lock:
+            conn = self._read()
+            conn.execute('DELETE FROM categories')
+            conn.executemany('INSERT INTO categories VALUES (?, ?)', categories)
+            conn.commit()
+
+    # Queries
+
+    def _where(self, category=None, min_price=None, max_price=None, min_rating=None):
+        clauses, params = [], []
+        for clause, value in (('category = ?', category), ('price >= ?', min_price),
+                              ('price <= ?', max_price), ('rating >= ?', min_rating)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return clauses, params
+
+    def page(self, sort='newest', cursor=None, limit=PAGE_SIZE, **filters):
+        # (product ids, next_cursor) for one page of the filtered listing.
+        # Cursors are those of the Firestore listing, so either can continue
+        # a page the other started.
+        column, direction = SORTS.get(sort, SORTS['newest'])
+        clauses, params = self._where(**filters)
+        position = decode_cursor(cursor)
+        if position is not None and len(position[0]) == 1:
+            (value,), doc_id = position
+            if column == 'created_at':
+                value = _timestamp(value)
+            clauses.append(f"({column}, id) {'<' if direction == 'DESC' else '>'} (?, ?)")
+            params += [value, doc_id]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._read().execute(
+                f'SELECT id, {column} FROM products {where} ORDER BY {column} {direction}, id {direction} LIMIT ?',
+                params + [limit + 1]).fetchall()
+        if len(rows) <= limit:
+            return [row[0] for row in rows], None
+        rows = rows[:limit]
+        doc_id, value = rows[-1]
+        if column == 'created_at':
+            value = datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+        return [row[0] for row in rows], encode_cursor([value], doc_id)
+
+    def count(self, **filters):
+        clauses, params = self._where(**filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            return self._read().execute(f'SELECT COUNT(*) FROM products {where}', params).fetchone()[0]
+
+    def category_name(self, category_id):
+        # Name of a mirrored category (what products store in `category`), or None
+        if self._categories_stale:
+            self._refresh_categories()
+        with self._lock:
+            row = self._read().execute('SELECT name FROM categories WHERE id = ?', (category_id,)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import firestore
+
+# Every category's product count lives in one document, keyed by category
+# name, so a page needs a single read to show all of them:
+#   stats/categoryCounts = {'counts': {'Shoes': 12, ...}, 'complete': True, 'updatedAt': ...}
+# Product writes adjust the counters with increments, which create the
+# document if it is missing; only a full recount sets `complete`, so a
+# document holding just those increments is not trusted.
+COUNTS_COLLECTION = 'stats'
+COUNTS_DOCUMENT = 'categoryCounts'
+
+
+def counts_ref(db):
+    return db.collection(COUNTS_COLLECTION).document(COUNTS_DOCUMENT)
+
+
+def get_category_counts(db):
+    # The counters, or None until a rebuild has counted every category
+    doc = counts_ref(db).get()
+    data = doc.to_dict() if doc.exists else {}
+    if data.get('complete') is not True:
+        return None
+    return data.get('counts', {})
+
+
+def _count_products(db, category_name):
+    result = db.collection('products').where('category', '==', category_name).count().get()
+    return int(result[0][0].value)
+
+
+def rebuild_category_counts(db, max_workers=8):
+    # Recount every category with server-side count aggregations, several
+    # at a time, and overwrite the counters document with the result
+    names = {doc.to_dict().get('categoryName', '') for doc in db.collection('categories').stream()}
+    names.discard('')
+    names = sorted(names)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        totals = list(executor.map(lambda name: _count_products(db, name), names))
+
+    counts = dict(zip(names, totals))
+    counts_ref(db).set({'counts': counts, 'complete': True, 'updatedAt': firestore.SERVER_TIMESTAMP})
+    return counts
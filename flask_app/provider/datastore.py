@@ -0,0 +1,190 @@
+import functools
+import json
+import os
+import threading
+from google.api_core import retry as retries
+from google.cloud import firestore
+from provider import startup
+
+# 'firestore' (default) talks to the Firebase project configured in .env;
+# 'memory' keeps everything in process memory and needs no credentials
+BACKEND = os.getenv('DATA_BACKEND', 'firestore').lower()
+
+# Optional JSON file of {collection_path: {doc_id: data}} loaded into the
+# memory backend at startup
+MEMORY_SEED_FILE = os.getenv('DATA_MEMORY_SEED')
+
+CREDENTIAL_VARIABLES = ('FIREBASE_PRIVATE_KEY_ID', 'FIREBASE_PRIVATE_KEY', 'FIREBASE_CLIENT_EMAIL',
+                        'FIREBASE_CLIENT_ID', 'FIREBASE_CLIENT_CERT_URL')
+
+_firebase_lock = threading.Lock()
+_auth = None
+
+
+def use_memory():
+    return BACKEND == 'memory'
+
+
+def firebase_credentials():
+    missing = [name for name in CREDENTIAL_VARIABLES if not os.getenv(name)]
+    if missing:
+        raise RuntimeError(f"Firebase credentials are not configured, set {', '.join(missing)} "
+                           f"(or DATA_BACKEND=memory)")
+    # Imported here: google.auth's transport stack is slow to import and
+    # only needed once a real client is made
+    from firebase_admin import credentials
+    return credentials.Certificate({
+        "type": "service_account",
+        "project_id": "daddy-ecom-store",
+        "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+        "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
+        "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
+        "client_id": os.getenv('FIREBASE_CLIENT_ID'),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
+    })
+
+
+def firebase_app():
+    # The default Firebase app, initialized on first use
+    import firebase_admin
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(firebase_credentials())
+        return firebase_admin.get_app()
+
+
+class LazyClient:
+    """Stands in for the database client and creates the real one on first use.
+
+    Importing the app therefore needs no credentials and opens no
+    connections. With ``per_process`` a process forked after the client was
+    made gets a client of its own: gRPC channels do not survive ``fork()``.
+    """
+
+    def __init__(self, factory, per_process=True):
+        self._factory = factory
+        self._per_process = per_process
+        self._client = None
+        self._pid = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_create(self, callback):
+        # callback(client) runs for every client made, including one that exists already
+        with self._lock:
+            self._callbacks.append(callback)
+            client = self._client
+        if client is not None:
+            callback(client)
+
+    @property
+    def client(self):
+        client = self._client
+        if client is not None and (not self._per_process or self._pid == os.getpid()):
+            return client
+        with self._lock:
+            if self._client is None or (self._per_process and self._pid != os.getpid()):
+                client = self._factory()
+                for callback in self._callbacks:
+                    callback(client)
+                self._client, self._pid = client, os.getpid()
+                startup.mark('client_ready')
+            return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _memory_client():
+    from provider.memory_store import MemoryClient
+    client = MemoryClient()
+    if MEMORY_SEED_FILE:
+        with open(MEMORY_SEED_FILE, encoding='utf-8') as f:
+            client.load(json.load(f))
+    return client
+
+
+def _firestore_client():
+    # A new client rather than firestore.client(): that one is cached on the
+    # Firebase app and would hand a forked worker its parent's channel
+    app = firebase_app()
+    return firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+
+
+def create_client():
+    # The database client for the configured backend, created on first use.
+    # The memory backend keeps one client across forks (it holds the data).
+    if use_memory():
+        return LazyClient(_memory_client, per_process=False)
+    return LazyClient(_firestore_client)
+
+
+class FirebaseAuth:
+    """The firebase_admin.auth calls the app makes, initializing the Firebase
+    app (and importing firebase_admin, which is slow to import) on first use."""
+
+    def _auth(self):
+        firebase_app()
+        from firebase_admin import auth
+        return auth
+
+    def get_user(self, uid):
+        return self._auth().get_user(uid)
+
+    def find_user(self, uid):
+        # Like get_user, but None for an unknown uid
+        auth = self._auth()
+        try:
+            return auth.get_user(uid)
+        except auth.UserNotFoundError:
+            return None
+
+    def get_user_by_email(self, email):
+        return self._auth().get_user_by_email(email)
+
+    def create_user(self, **kwargs):
+        return self._auth().create_user(**kwargs)
+
+    def update_user(self, uid, **kwargs):
+        return self._auth().update_user(uid, **kwargs)
+
+    def delete_user(self, uid):
+        return self._auth().delete_user(uid)
+
+
+def create_auth():
+    # Object exposing the firebase_admin.auth calls the app makes; one per process
+    global _auth
+    if _auth is None:
+        if use_memory():
+            from provider.memory_store import MemoryAuth
+            _auth = MemoryAuth()
+        else:
+            _auth = FirebaseAuth()
+    return _auth
+
+
+def transactional(fn):
+    # Like firestore.transactional, for either backend: call the result with
+    # a transaction from db.transaction() followed by the function's other
+    # arguments
+    firestore_fn = firestore.transactional(fn)
+
+    @functools.wraps(fn)
+    def wrapper(transaction, *args, **kwargs):
+        if use_memory():
+            return transaction.run(fn, *args, **kwargs)
+        return firestore_fn(transaction, *args, **kwargs)
+    return wrapper
+
+
+def rpc_deadline(timeout=None):
+    # Keyword arguments bounding one Firestore call, retries included, to
+    # `timeout` seconds (none when it is None), so a read its caller has
+    # given up on does not keep a thread busy for the client's default
+    if timeout is None:
+        return {}
+    return {'timeout': timeout, 'retry': retries.Retry(timeout=timeout)}
@@ -0,0 +1,76 @@
+from flask import g, has_request_context
+from provider import metrics
+
+# Calls that write documents; any of them drops the request's identity map
+WRITE_METHODS = ('commit', 'batch_write')
+
+
+def _identity_map():
+    # Snapshots already read in this request, keyed by document path; None
+    # outside a request (CLI commands, background jobs), which always read
+    if not has_request_context():
+        return None
+    if '_documents' not in g:
+        g._documents = {}
+    return g._documents
+
+
+def get_document(ref):
+    # A document snapshot, fetched at most once per request. Snapshots are
+    # shared, but to_dict() hands out a copy, so callers can't affect each other.
+    documents = _identity_map()
+    if documents is None:
+        return ref.get()
+    doc = documents.get(ref.path)
+    if doc is None:
+        doc = ref.get()
+        documents[ref.path] = doc
+    return doc
+
+
+def get_many_by_collection(db, ids_by_collection):
+    # Fetch documents from several collections in a single round trip.
+    # Takes {collection: [doc_id, ...]}; ids are deduplicated and falsy ones
+    # skipped. Returns {collection: {doc_id: data}} for documents that exist.
+    # Documents already read in this request are not fetched again.
+    documents = _identity_map()
+    snapshots, refs = [], []
+    for collection, doc_ids in ids_by_collection.items():
+        for doc_id in dict.fromkeys(doc_id for doc_id in doc_ids if doc_id):
+            ref = db.collection(collection).document(doc_id)
+            cached = documents.get(ref.path) if documents is not None else None
+            if cached is not None:
+                snapshots.append(cached)
+            else:
+                refs.append(ref)
+
+    if refs:
+        for doc in db.get_all(refs):
+            if documents is not None:
+                documents[doc.reference.path] = doc
+            snapshots.append(doc)
+
+    found = {collection: {} for collection in ids_by_collection}
+    for doc in snapshots:
+        if doc.exists:
+            found[doc.reference.parent.id][doc.id] = doc.to_dict()
+    return found
+
+
+def get_many(db, collection, doc_ids):
+    # Fetch several documents of one collection in a single round trip;
+    # returns {doc_id: data} for the documents that exist
+    return get_many_by_collection(db, {collection: doc_ids})[collection]
+
+
+def _on_firestore_call(method, started, seconds, reads, writes):
+    # Batches and transactions don't report which documents they touched,
+    # so a write in this request invalidates everything read so far
+    if method in WRITE_METHODS and writes:
+        documents = _identity_map()
+        if documents:
+            documents.clear()
+
+
+def init_app(app):
+    metrics.add_firestore_observer(_on_firestore_call)
@@ -0,0 +1,93 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from provider import tracing
+
+# One pool shared by every request, so a burst of traffic cannot start an
+# unbounded number of threads
+MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', 16))
+
+# Seconds a single call may take before its result is given up on
+DEFAULT_TIMEOUT = float(os.getenv('FANOUT_TIMEOUT', 5))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_RAISE = object()
+
+
+class FanOutTimeout(Exception):
+    def __init__(self, name, timeout):
+        super().__init__(f'{name} did not finish within {timeout}s')
+        self.name = name
+        self.timeout = timeout
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='fanout')
+        return _executor
+
+
+def _run(name, fn, args, kwargs):
+    with tracing.span(f'fanout {name}', 'fanout'):
+        return fn(*args, **kwargs)
+
+
+class FanOut:
+    """Runs the independent reads of one request concurrently.
+
+    Calls are submitted by name and collected with ``result(name)``; each
+    one has its own deadline counted from when it was submitted. Calls run
+    in a copy of the caller's context, so ``flask.g`` and the request are
+    visible to them. Use it as a context manager: leaving the block cancels
+    whatever has not started yet.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool=None):
+        self.timeout = timeout
+        self._pool = pool or executor()
+        self._calls = {}   # name -> (future, deadline, timeout, default)
+
+    def submit(self, name, fn, *args, timeout=None, default=_RAISE, **kwargs):
+        # `default` is returned instead of raising when the call times out
+        # or fails
+        timeout = self.timeout if timeout is None else timeout
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, _run, name, fn, args, kwargs)
+        self._calls[name] = (future, time.monotonic() + timeout, timeout, default)
+        return self
+
+    def result(self, name):
+        future, deadline, timeout, default = self._calls[name]
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            if default is not _RAISE:
+                return default
+            raise FanOutTimeout(name, timeout) from None
+        except Exception:
+            if default is not _RAISE:
+                return default
+            raise
+
+    def results(self):
+        return {name: self.result(name) for name in self._calls}
+
+    def cancel(self):
+        # A call that is already running cannot be interrupted; it finishes
+        # in the background and its result is dropped
+        for future, _, _, _ in self._calls.values():
+            future.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancel()
+        return False
@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+import os
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses are offered gzip only
+    brotli = None
+
+# Bodies smaller than this are sent as they are; compressing them saves
+# less than the header costs
+MIN_COMPRESS_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 512))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def content_etag(body):
+    # Strong validator for a representation: a hash of its bytes, so every
+    # worker gives the same content the same tag
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def choose_encoding(body):
+    # The best encoding this request accepts for `body`, or None to send it as is
+    if len(body) < MIN_COMPRESS_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output, and so the ETag, stable
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+class Representation:
+    """A response body with its validator, compressed on demand and kept.
+
+    Build one per distinct resource state and reuse it: the encoded copies
+    are made the first time a client asks for them. Each encoding gets its own
+    strong ETag (``"<hash>"``, ``"<hash>-gzip"``, ``"<hash>-br"``) because
+    the bytes differ; a conditional request matches on the shared hash.
+    """
+
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', '_encoded')
+
+    def __init__(self, body, mimetype, last_modified=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = content_etag(body)
+        self.last_modified = last_modified
+        self._encoded = {None: body}
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = compress(self.body, encoding)
+        return data
+
+    def precompress(self):
+        # Encode up front every way a client may ask for, so no request waits on it
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            for encoding in ENCODINGS:
+                self.encoded(encoding)
+
+    def is_fresh(self):
+        # True when the request's validators show the client has this content
+        if request.if_none_match:
+            return any(request.if_none_match.contains(self._tag(encoding))
+                       for encoding in (None, 'gzip', 'br')) or request.if_none_match.star_tag
+        if self.last_modified is not None and request.if_modified_since is not None:
+            return self.last_modified.replace(microsecond=0) <= request.if_modified_since
+        return False
+
+    def _tag(self, encoding):
+        return self.etag if encoding is None else f'{self.etag}-{encoding}'
+
+    def respond(self, app, cache_control='no-cache', status=200):
+        # The full response, or 304 Not Modified when the client's copy is current
+        encoding = choose_encoding(self.body)
+        if status == 200 and self.is_fresh():
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(self.encoded(encoding), status=status, mimetype=self.mimetype)
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self._tag(encoding))
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
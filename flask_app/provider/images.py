@@ -0,0 +1,188 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Widths (px) of the resized copies; an image is never scaled up, so smaller
+# originals get fewer variants and their own width as the largest
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+
+# Every width is written in each format: WebP for browsers that take it,
+# JPEG as the fallback (and as the canonical URL)
+FORMATS = {
+    'webp': ('image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+
+# Decoding and encoding run in separate processes, so they neither hold the
+# GIL for request threads nor block them on one core
+WORKERS = int(os.getenv('IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+PROCESS_TIMEOUT = float(os.getenv('IMAGE_PROCESS_TIMEOUT', 60))
+
+KEY_PREFIX = 'images'
+
+# Canonical URL of a processed image: <base>/images/<hash>/<largest width>.jpg
+_CANONICAL = re.compile(r'^(?P<base>.*/' + KEY_PREFIX + r'/(?P<digest>[0-9a-f]{32}))/(?P<width>\d+)\.jpg$')
+
+
+class ImageError(Exception):
+    pass
+
+
+def render_variants(data):
+    # Runs in a worker process: decode once, then resize step by step from
+    # the largest width down, encoding every size in every format.
+    # Returns (width, height, {(width, ext): bytes}).
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise ImageError('Image is too large')
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ImageError('Not a supported image file') from e
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # No transparency in JPEG: flatten onto white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    width, height = image.size
+    widths = sorted({w for w in VARIANT_WIDTHS if w < width} | {min(width, VARIANT_WIDTHS[-1])}, reverse=True)
+    variants = {}
+    current = image
+    for w in widths:
+        h = max(1, round(height * w / width))
+        if current.size != (w, h):
+            current = current.resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+        for ext, (_, options) in FORMATS.items():
+            out = io.BytesIO()
+            current.save(out, format='WEBP' if ext == 'webp' else 'JPEG', **options)
+            variants[(w, ext)] = out.getvalue()
+    return width, height, variants
+
+
+def variant_key(digest, width, ext):
+    return f'{KEY_PREFIX}/{digest}/{width}.{ext}'
+
+
+def variant_widths(largest):
+    return [w for w in VARIANT_WIDTHS if w < largest] + [largest]
+
+
+def parse_url(url):
+    # (base, largest width) for a URL made by the pipeline, else None
+    match = _CANONICAL.match(url or '')
+    if match is None:
+        return None
+    return match.group('base'), int(match.group('width'))
+
+
+def variant_url(url, width, ext='jpg'):
+    # The smallest variant at least `width` pixels wide (or the largest there
+    # is); any other URL is returned unchanged
+    parsed = parse_url(url)
+    if parsed is None:
+        return url
+    base, largest = parsed
+    chosen = next((w for w in variant_widths(largest) if w >= width), largest)
+    return f'{base}/{chosen}.{ext}'
+
+
+def srcset(url, ext='jpg'):
+    # "url 160w, url 320w, ..." for a pipeline URL; '' for any other
+    parsed = parse_url(url)
+    if parsed is None:
+        return ''
+    base, largest = parsed
+    return ', '.join(f'{base}/{w}.{ext} {w}w' for w in variant_widths(largest))
+
+
+class ImagePipeline:
+    """Turns uploaded image bytes into stored, resized WebP/JPEG variants.
+
+    Images are keyed by a hash of their content, so uploading the same file
+    twice stores it once. ``ingest`` returns the canonical URL (the largest
+    JPEG); templates derive the other sizes from it with ``srcset``.
+    """
+
+    def __init__(self, store, workers=WORKERS):
+        self.store = store
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # Created on first use, in the process that uses it. 'spawn' keeps
+        # the workers clear of the parent's Firestore/gRPC threads.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _manifest_key(self, digest):
+        return f'{KEY_PREFIX}/{digest}/manifest.json'
+
+    def _existing(self, digest):
+        manifest = self.store.get(self._manifest_key(digest))
+        if manifest is None:
+            return None
+        largest = json.loads(manifest)['widths'][-1]
+        return self.store.url(variant_key(digest, largest, 'jpg'))
+
+    def _store(self, digest, width, height, variants):
+        for (w, ext), data in variants.items():
+            self.store.put(variant_key(digest, w, ext), data, FORMATS[ext][0])
+        widths = sorted({w for w, _ in variants})
+        # The manifest goes last: once it exists every variant does
+        self.store.put(self._manifest_key(digest),
+                       json.dumps({'width': width, 'height': height, 'widths': widths}).encode(),
+                       'application/json')
+        return self.store.url(variant_key(digest, widths[-1], 'jpg'))
+
+    def ingest(self, data):
+        return self.ingest_many([data])[0]
+
+    def ingest_many(self, images):
+        # Process several images in parallel; returns their canonical URLs in order
+        digests, found, pending = [], {}, {}
+        for data in images:
+            if not data:
+                raise ImageError('Empty file')
+            if len(data) > MAX_UPLOAD_BYTES:
+                raise ImageError(f'Images must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+            digest = hashlib.sha256(data).hexdigest()[:32]
+            digests.append(digest)
+            if digest in found or digest in pending:
+                continue
+            url = self._existing(digest)
+            if url is not None:
+                found[digest] = url
+            else:
+                pending[digest] = self._executor().submit(render_variants, data)
+        for digest, future in pending.items():
+            found[digest] = self._store(digest, *future.result(timeout=PROCESS_TIMEOUT))
+        return [found[digest] for digest in digests]
+
+
+def init_app(app):
+    # Template filters: {{ url|image_src(320) }} and {{ url|srcset('webp') }}
+    app.add_template_filter(variant_url, 'image_src')
+    app.add_template_filter(srcset, 'srcset')
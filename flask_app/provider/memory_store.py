@@ -0,0 +1,918 @@
+import datetime
+import functools
+import heapq
+import itertools
+import math
+import queue
+import threading
+import time
+import uuid
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+
+# In-memory stand-in for the subset of the Firestore client this app uses:
+# collections and subcollections, documents, where/order_by/limit/offset/
+# select, cursors, count/sum/avg aggregations, get_all, batched writes,
+# transactions, SERVER_TIMESTAMP/Increment/ArrayUnion/ArrayRemove/DELETE_FIELD
+# and on_snapshot listeners. Everything lives in one process and is lost on
+# exit; it exists so the app can be run, profiled and load-tested without a
+# Firebase project.
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+DOCUMENT_ID = '__name__'
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _auto_id():
+    return uuid.uuid4().hex[:20]
+
+
+def _copy(value):
+    # Cheaper than copy.deepcopy for plain Firestore data
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _split_path(field_path):
+    if isinstance(field_path, (list, tuple)):
+        return list(field_path)
+    parts, current, quoted = [], '', False
+    for char in field_path:
+        if char == '`':
+            quoted = not quoted
+        elif char == '.' and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+_MISSING = object()
+
+
+def _lookup(data, field_path):
+    value = data
+    for part in _split_path(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+# Values of different types sort by type first, in Firestore's order
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, DocumentReference):
+        return 6
+    if isinstance(value, list):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 7
+
+
+def _sort_value(value):
+    rank = _type_rank(value)
+    if rank == 0:
+        return (0, 0)
+    if rank == 2 and isinstance(value, float) and math.isnan(value):
+        return (2, float('-inf'))
+    if rank == 3 and value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    if rank == 6:
+        value = value.path
+    if rank == 8:
+        return (8, tuple(_sort_value(v) for v in value))
+    if rank == 9:
+        return (9, tuple(sorted((k, _sort_value(v)) for k, v in value.items())))
+    if rank == 7:
+        return (7, repr(value))
+    return (rank, value)
+
+
+def _compare(a, b):
+    a, b = _sort_value(a), _sort_value(b)
+    return (a > b) - (a < b)
+
+
+def _matches(value, op, operand):
+    if op in ('==', '!=', 'in', 'not-in') and value is _MISSING:
+        return False
+    if op == '==':
+        return _type_rank(value) == _type_rank(operand) and _compare(value, operand) == 0
+    if op == '!=':
+        return value is not None and not (_type_rank(value) == _type_rank(operand)
+                                          and _compare(value, operand) == 0)
+    if op == 'in':
+        return any(_matches(value, '==', candidate) for candidate in operand)
+    if op == 'not-in':
+        return value is not None and not any(_matches(value, '==', candidate) for candidate in operand)
+    if op == 'array_contains':
+        return isinstance(value, list) and any(_matches(item, '==', operand) for item in value)
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(_matches(item, '==', candidate)
+                                               for item in value for candidate in operand)
+    # Range comparisons only match values of the same type
+    if value is _MISSING or _type_rank(value) != _type_rank(operand):
+        return False
+    result = _compare(value, operand)
+    return {'<': result < 0, '<=': result <= 0, '>': result > 0, '>=': result >= 0}[op]
+
+
+def _apply_transform(current, value, now):
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        if isinstance(current, (int, float)) and not isinstance(current, bool):
+            return current + value.value
+        return value.value
+    if isinstance(value, transforms.ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        for item in value.values:
+            if not any(_matches(existing, '==', item) for existing in result):
+                result.append(_copy(item))
+        return result
+    if isinstance(value, transforms.ArrayRemove):
+        if not isinstance(current, list):
+            return []
+        return [item for item in current if not any(_matches(item, '==', v) for v in value.values)]
+    if isinstance(value, dict):
+        return _plain(value, now)
+    return _copy(value)
+
+
+def _set_path(data, parts, value, now):
+    for part in parts[:-1]:
+        child = data.get(part)
+        if not isinstance(child, dict):
+            child = data[part] = {}
+        data = child
+    if value is transforms.DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = _apply_transform(data.get(parts[-1]), value, now)
+
+
+def _merge(data, updates, now):
+    # set(..., merge=True): nested maps are merged, everything else replaced
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            _merge(data[key], value, now)
+        elif isinstance(value, dict):
+            data[key] = {}
+            _merge(data[key], value, now)
+        else:
+            _set_path(data, [key], value, now)
+
+
+def _plain(data, now):
+    # A document written with set(): resolve sentinels, drop DELETE_FIELD
+    result = {}
+    _merge(result, data, now)
+    return result
+
+
+class AggregationResult:
+    def __init__(self, alias, value, read_time=None):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, exists, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self._data = data
+        self.exists = exists
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    def to_dict(self):
+        return _copy(self._data) if self.exists else None
+
+    def get(self, field_path):
+        if not self.exists:
+            return None
+        value = _lookup(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class DocumentChange:
+    def __init__(self, change_type, document, old_index=-1, new_index=-1):
+        self.type = change_type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other._path == self._path
+
+    def __hash__(self):
+        return hash(self._path)
+
+    def __repr__(self):
+        return f'<DocumentReference {self._path}>'
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._path.rsplit('/', 1)[0])
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f'{self._path}/{collection_id}')
+
+    def collections(self):
+        prefix = self._path + '/'
+        return [CollectionReference(self._client, path) for path in self._client._collection_paths()
+                if path.startswith(prefix) and '/' not in path[len(prefix):]]
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        return self._client._get_all([self], field_paths)[0]
+
+    def create(self, document_data):
+        return self._client._commit([('create', self, document_data)])[0]
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self, field_updates)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self)])[0].update_time
+
+    def on_snapshot(self, callback):
+        return Watch(self._client, Query(self.parent, filters=[(DOCUMENT_ID, '==', self.id)]), callback)
+
+
+class Query:
+    def __init__(self, parent, filters=None, orders=None, limit=None, limit_to_last=False,
+                 offset=None, projection=None, start=None, end=None):
+        self._parent = parent
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit
+        self._limit_to_last = limit_to_last
+        self._offset = offset
+        self._projection = projection
+        self._start = start   # (values, before) where before=True means start_at
+        self._end = end   # (values, before) where before=True means end_before
+
+    @property
+    def _client(self):
+        return self._parent._client
+
+    def _copy_with(self, **changes):
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      limit_to_last=self._limit_to_last, offset=self._offset,
+                      projection=self._projection, start=self._start, end=self._end)
+        fields.update(changes)
+        return Query(self._parent, **fields)
+
+    # Building
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if not isinstance(field_path, str):
+            field_path = '.'.join(field_path)
+        return self._copy_with(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy_with(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy_with(limit=count, limit_to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy_with(limit=count, limit_to_last=True)
+
+    def offset(self, num_to_skip):
+        return self._copy_with(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy_with(projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy_with(start=(document_fields_or_snapshot, True))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy_with(start=(document_fields_or_snapshot, False))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy_with(end=(document_fields_or_snapshot, True))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy_with(end=(document_fields_or_snapshot, False))
+
+    # Aggregations
+
+    def count(self, alias=None):
+        return AggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return AggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return AggregationQuery(self).avg(field_ref, alias)
+
+    # Running
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        # Like Firestore: an inequality filter implies ordering by that field
+        if not orders:
+            for field_path, op, _ in self._filters:
+                if op in ('<', '<=', '>', '>=', '!=', 'not-in') and field_path != DOCUMENT_ID:
+                    orders.append((field_path, ASCENDING))
+                    break
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else ASCENDING))
+        return orders
+
+    def _field_value(self, doc_id, data, field_path):
+        return doc_id if field_path == DOCUMENT_ID else _lookup(data, field_path)
+
+    def _accepts(self, doc_id, data):
+        for field_path, op, value in self._filters:
+            if field_path == DOCUMENT_ID and isinstance(value, DocumentReference):
+                value = value.id
+            elif field_path == DOCUMENT_ID and op in ('in', 'not-in'):
+                value = [v.id if isinstance(v, DocumentReference) else v for v in value]
+            if not _matches(self._field_value(doc_id, data, field_path), op, value):
+                return False
+        return True
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, DocumentSnapshot):
+            return [cursor.id if field == DOCUMENT_ID else _lookup(cursor._data, field)
+                    for field, _ in orders]
+        if isinstance(cursor, dict):
+            values = []
+            for field, _ in orders:
+                if field in cursor:
+                    value = cursor[field]
+                    if field == DOCUMENT_ID and isinstance(value, DocumentReference):
+                        value = value.id
+                    elif field == DOCUMENT_ID and isinstance(value, str) and '/' in value:
+                        value = value.rsplit('/', 1)[-1]
+                    values.append(value)
+                else:
+                    break
+            return values
+        return list(cursor)
+
+    def _compare_to_cursor(self, key, cursor_values, orders):
+        for value, cursor_value, (_, direction) in zip(key, cursor_values, orders):
+            result = _compare(value, cursor_value)
+            if result:
+                return result if direction == ASCENDING else -result
+        return 0
+
+    def _run(self):
+        # Returns [(doc_id, data, meta)] in query order
+        orders = self._effective_orders()
+        rows = []
+        for doc_id, (data, meta) in self._client._collection(self._parent._path).items():
+            if not self._accepts(doc_id, data):
+                continue
+            key = []
+            for field_path, _ in orders:
+                value = self._field_value(doc_id, data, field_path)
+                if value is _MISSING:
+                    break   # ordering by a field excludes documents without it
+                key.append(value)
+            else:
+                rows.append((key, doc_id, data, meta))
+
+        if self._start is not None:
+            values, inclusive = self._cursor_values(self._start[0], orders), self._start[1]
+            rows = [row for row in rows
+                    if self._compare_to_cursor(row[0], values, orders) >= (0 if inclusive else 1)]
+        if self._end is not None:
+            values, exclusive = self._cursor_values(self._end[0], orders), self._end[1]
+            rows = [row for row in rows
+                    if self._compare_to_cursor(row[0], values, orders) <= (-1 if exclusive else 0)]
+
+        sort_key = functools.cmp_to_key(
+            lambda a, b: self._compare_to_cursor(a[0], b[0], orders))
+        offset = self._offset or 0
+        if self._limit is not None and not self._limit_to_last:
+            rows = heapq.nsmallest(offset + self._limit, rows, key=sort_key)[offset:]
+        else:
+            rows.sort(key=sort_key)
+            rows = rows[offset:]
+            if self._limit is not None:
+                rows = rows[-self._limit:] if self._limit else []
+        return [(doc_id, data, meta) for _, doc_id, data, meta in rows]
+
+    def _snapshot(self, doc_id, data, meta, read_time):
+        if self._projection is not None:
+            projected = {}
+            for field_path in self._projection:
+                value = _lookup(data, field_path)
+                if value is not _MISSING:
+                    _set_path(projected, _split_path(field_path), value, read_time)
+            data = projected
+        return DocumentSnapshot(self._parent.document(doc_id), data, True,
+                                meta[0], meta[1], read_time)
+
+    def stream(self, transaction=None, **kwargs):
+        started = time.perf_counter()
+        with self._client._lock:
+            rows = self._run()
+        read_time = _now()
+        snapshots = [self._snapshot(doc_id, data, meta, read_time) for doc_id, data, meta in rows]
+        self._client._observe('run_query', started, reads=max(len(snapshots), 1))
+        return iter(snapshots)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return Watch(self._client, self, callback)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        self._owner = client
+        self._path = path
+        super().__init__(self)
+
+    @property
+    def _client(self):
+        return self._owner
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        if '/' not in self._path:
+            return None
+        return DocumentReference(self._owner, self._path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._owner, f'{self._path}/{document_id or _auto_id()}')
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self, page_size=None):
+        with self._owner._lock:
+            ids = list(self._owner._collection(self._path))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class AggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field, alias):
+        self._aggregations.append((kind, field, alias or f'field_{len(self._aggregations) + 1}'))
+        return self
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, transaction=None, **kwargs):
+        started = time.perf_counter()
+        client = self._query._client
+        with client._lock:
+            rows = self._query._run()
+        read_time = _now()
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = len(rows)
+            else:
+                numbers = [v for v in (_lookup(data, field) for _, data, _ in rows)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(AggregationResult(alias, value, read_time))
+        # Billed as one read per batch of up to 1000 index entries
+        client._observe('run_aggregation_query', started, reads=max(math.ceil(len(rows) / 1000), 1))
+        return [results]
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self.get(transaction=transaction))
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference))
+
+    def commit(self, **kwargs):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+
+class MemoryTransaction(WriteBatch):
+    """Runs a transactional function under the client's lock, so it is
+    serializable by construction; writes are buffered and applied together
+    when the function returns. Use through ``provider.datastore.transactional``.
+    """
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self.in_progress = False
+
+    def get_all(self, references, **kwargs):
+        return iter(self._client._get_all(list(references)))
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter(self._client._get_all([ref_or_query]))
+        return ref_or_query.stream(transaction=self)
+
+    def run(self, fn, *args, **kwargs):
+        with self._client._lock:
+            self.in_progress = True
+            self._writes = []
+            try:
+                result = fn(self, *args, **kwargs)
+            except BaseException:
+                self._writes = []
+                raise
+            finally:
+                self.in_progress = False
+            if self._read_only and self._writes:
+                raise ValueError('Cannot perform write operation in read-only transaction.')
+            self.commit()
+            return result
+
+
+class Watch:
+    """on_snapshot listener. Snapshots are delivered on a background thread,
+    the first one with every matching document as ADDED."""
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._results = {}   # doc_id -> snapshot
+        self._queue = queue.Queue()
+        self._active = True
+        with client._lock:
+            rows = query._run()
+            read_time = _now()
+            changes = []
+            for index, (doc_id, data, meta) in enumerate(rows):
+                snapshot = query._snapshot(doc_id, data, meta, read_time)
+                self._results[doc_id] = snapshot
+                changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, index))
+            self._queue.put((list(self._results.values()), changes, read_time))
+            client._watches.append(self)
+        self._thread = threading.Thread(target=self._deliver, name='memory-watch', daemon=True)
+        self._thread.start()
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def unsubscribe(self):
+        self._active = False
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+        self._queue.put(None)
+
+    close = unsubscribe
+
+    def _on_commit(self, collection_path, changed, read_time):
+        # Called with the client lock held, for every committed write
+        if collection_path != self._query._parent._path:
+            return
+        changes = []
+        for doc_id, (data, meta) in changed.items():
+            before = self._results.get(doc_id)
+            matches = data is not None and self._query._accepts(doc_id, data)
+            if matches:
+                snapshot = self._query._snapshot(doc_id, data, meta, read_time)
+                self._results[doc_id] = snapshot
+                changes.append(DocumentChange(ChangeType.MODIFIED if before else ChangeType.ADDED, snapshot))
+            elif before is not None:
+                del self._results[doc_id]
+                changes.append(DocumentChange(ChangeType.REMOVED, before))
+        if changes:
+            self._queue.put((list(self._results.values()), changes, read_time))
+
+    def _deliver(self):
+        while True:
+            item = self._queue.get()
+            if item is None or not self._active:
+                return
+            try:
+                self._callback(*item)
+            except Exception:
+                pass
+
+
+class MemoryClient:
+    """Drop-in for ``firestore.client()`` backed by process memory."""
+
+    def __init__(self, project='memory'):
+        self.project = project
+        self._data = {}   # collection path -> {doc_id: (data, (create_time, update_time))}
+        self._lock = threading.RLock()
+        self._watches = []
+        self._observer = None
+
+    # Hooks
+
+    def set_call_observer(self, callback):
+        # callback(method, started, reads, writes) after each simulated API
+        # call, named like the real RPCs
+        self._observer = callback
+
+    def _observe(self, method, started, reads=0, writes=0):
+        if self._observer is not None:
+            self._observer(method, started, reads, writes)
+
+    # References
+
+    def collection(self, *collection_path):
+        return CollectionReference(self, '/'.join(collection_path))
+
+    def document(self, *document_path):
+        return DocumentReference(self, '/'.join(document_path))
+
+    def collections(self):
+        with self._lock:
+            return [CollectionReference(self, path) for path in self._data if '/' not in path]
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def bulk_writer(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False, **kwargs):
+        return MemoryTransaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        return iter(self._get_all(list(references), field_paths))
+
+    # Storage
+
+    def _collection(self, path):
+        return self._data.get(path, {})
+
+    def _collection_paths(self):
+        with self._lock:
+            return list(self._data)
+
+    def _get_all(self, references, field_paths=None):
+        started = time.perf_counter()
+        read_time = _now()
+        snapshots = []
+        with self._lock:
+            for ref in references:
+                collection_path, doc_id = ref.path.rsplit('/', 1)
+                entry = self._data.get(collection_path, {}).get(doc_id)
+                if entry is None:
+                    snapshots.append(DocumentSnapshot(ref, None, False, read_time=read_time))
+                    continue
+                data, (create_time, update_time) = entry
+                if field_paths is not None:
+                    projected = {}
+                    for field_path in field_paths:
+                        value = _lookup(data, field_path)
+                        if value is not _MISSING:
+                            _set_path(projected, _split_path(field_path), value, read_time)
+                    data = projected
+                snapshots.append(DocumentSnapshot(ref, data, True, create_time, update_time, read_time))
+        self._observe('batch_get_documents', started, reads=len(references))
+        return snapshots
+
+    def _commit(self, writes):
+        # Apply every write atomically; returns a WriteResult per write
+        started = time.perf_counter()
+        now = _now()
+        with self._lock:
+            staged = {}   # path -> (data or None, meta)
+
+            def current(ref):
+                if ref.path in staged:
+                    return staged[ref.path]
+                collection_path, doc_id = ref.path.rsplit('/', 1)
+                return self._data.get(collection_path, {}).get(doc_id, (None, None))
+
+            for write in writes:
+                kind, ref = write[0], write[1]
+                data, meta = current(ref)
+                create_time = meta[0] if meta else now
+                if kind == 'create':
+                    if data is not None:
+                        raise AlreadyExists(f'Document already exists: {ref.path}')
+                    staged[ref.path] = (_plain(write[2], now), (now, now))
+                elif kind == 'set':
+                    document_data, merge = write[2], write[3]
+                    if merge and data is not None:
+                        merged = _copy(data)
+                        _merge(merged, document_data, now)
+                        staged[ref.path] = (merged, (create_time, now))
+                    else:
+                        staged[ref.path] = (_plain(document_data, now), (create_time, now))
+                elif kind == 'update':
+                    if data is None:
+                        raise NotFound(f'No document to update: {ref.path}')
+                    updated = _copy(data)
+                    for field_path, value in write[2].items():
+                        _set_path(updated, _split_path(field_path), value, now)
+                    staged[ref.path] = (updated, (create_time, now))
+                elif kind == 'delete':
+                    staged[ref.path] = (None, None)
+
+            changed_by_collection = {}
+            for path, (data, meta) in staged.items():
+                collection_path, doc_id = path.rsplit('/', 1)
+                collection = self._data.setdefault(collection_path, {})
+                if data is None:
+                    collection.pop(doc_id, None)
+                else:
+                    collection[doc_id] = (data, meta)
+                changed_by_collection.setdefault(collection_path, {})[doc_id] = (data, meta)
+            for collection_path, changed in changed_by_collection.items():
+                for watch in list(self._watches):
+                    watch._on_commit(collection_path, changed, now)
+        self._observe('commit', started, writes=len(writes))
+        return [WriteResult(now) for _ in writes]
+
+    # Seeding and inspection
+
+    def load(self, collections):
+        # Bulk-load {collection_path: {doc_id: data}} without per-write overhead
+        now = _now()
+        with self._lock:
+            for collection_path, documents in collections.items():
+                collection = self._data.setdefault(collection_path, {})
+                changed = {}
+                for doc_id, data in documents.items():
+                    entry = (_plain(data, now), (now, now))
+                    collection[doc_id] = entry
+                    changed[doc_id] = entry
+                for watch in list(self._watches):
+                    watch._on_commit(collection_path, changed, now)
+
+    def dump(self):
+        with self._lock:
+            return {path: {doc_id: _copy(data) for doc_id, (data, _) in docs.items()}
+                    for path, docs in self._data.items()}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class AuthError(Exception):
+    """Base of the errors MemoryAuth raises, named after their
+    firebase_admin.auth counterparts so the memory backend does not need
+    the Firebase SDK."""
+
+
+class EmailAlreadyExistsError(AuthError):
+    pass
+
+
+class UserNotFoundError(AuthError):
+    pass
+
+
+class MemoryUser:
+    def __init__(self, uid, email, display_name=None, phone_number=None, photo_url=None, disabled=False):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.phone_number = phone_number
+        self.photo_url = photo_url
+        self.disabled = disabled
+
+
+class MemoryAuth:
+    """Stand-in for the ``firebase_admin.auth`` calls the app makes."""
+
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def create_user(self, email=None, password=None, uid=None, **kwargs):
+        with self._lock:
+            if any(user.email == email for user in self._users.values()):
+                raise EmailAlreadyExistsError(f'The user with the provided email already exists ({email}).')
+            uid = uid or f'user{next(self._ids):06d}'
+            user = MemoryUser(uid, email, **{k: v for k, v in kwargs.items()
+                                             if k in ('display_name', 'phone_number', 'photo_url', 'disabled')})
+            self._users[uid] = user
+            return user
+
+    def get_user(self, uid):
+        user = self._users.get(uid)
+        if user is None:
+            raise UserNotFoundError(f'No user record found for the provided user ID: {uid}.')
+        return user
+
+    def find_user(self, uid):
+        return self._users.get(uid)
+
+    def get_user_by_email(self, email):
+        for user in list(self._users.values()):
+            if user.email == email:
+                return user
+        raise UserNotFoundError(f'No user record found for the provided email: {email}.')
+
+    def update_user(self, uid, **kwargs):
+        user = self.get_user(uid)
+        for key, value in kwargs.items():
+            if hasattr(user, key):
+                setattr(user, key, value)
+        return user
+
+    def delete_user(self, uid):
+        with self._lock:
+            self._users.pop(uid, None)
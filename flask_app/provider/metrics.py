@@ -0,0 +1,393 @@
+import contextvars
+import os
+import threading
+import time
+from flask import g, request, Response
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Firestore API calls that return documents (and are billed per document)
+READ_METHODS = ('batch_get_documents', 'run_query', 'run_aggregation_query', 'list_documents')
+
+_current = contextvars.ContextVar('firestore_request_stats', default=None)
+
+# Callbacks told about every Firestore call, see add_firestore_observer()
+_observers = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in items]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{name}{_format_labels(labels)} {value}' for name, labels, value in self.samples()]
+        return lines
+
+
+class Gauge:
+    """A value read from ``callback`` at scrape time."""
+
+    def __init__(self, name, help, callback):
+        self.name = name
+        self.help = help
+        self.callback = callback
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def quantile(self, q, **labels):
+        # Upper bucket bound below which a fraction `q` of observations fall
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if not entry or not entry[-1]:
+                return None
+            wanted = q * entry[-1]
+            for i, bound in enumerate(self.buckets):
+                if entry[i] >= wanted:
+                    return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", bound)])} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {entry[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {entry[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {entry[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, callback):
+        return self._add(Gauge(name, help, callback))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status.',
+    ('endpoint', 'method', 'status'))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by endpoint.',
+    ('endpoint',))
+firestore_reads = registry.counter(
+    'firestore_document_reads_total', 'Documents read from Firestore, by endpoint.',
+    ('endpoint',))
+firestore_writes = registry.counter(
+    'firestore_document_writes_total', 'Documents written to Firestore, by endpoint.',
+    ('endpoint',))
+firestore_calls = registry.counter(
+    'firestore_round_trips_total', 'Firestore API calls, by endpoint and method.',
+    ('endpoint', 'method'))
+firestore_seconds = registry.counter(
+    'firestore_seconds_total', 'Wall time spent in Firestore API calls, by endpoint.',
+    ('endpoint',))
+firestore_per_request = registry.histogram(
+    'firestore_reads_per_request', 'Documents read from Firestore per request, by endpoint.',
+    ('endpoint',), buckets=(0, 1, 5, 10, 25, 50, 100, 250, 1000, 5000))
+
+
+class RequestStats:
+    """Firestore usage of one request (or of one background job)."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.reads = 0
+        self.writes = 0
+        self.round_trips = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, method, reads=0, writes=0, seconds=0.0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.round_trips += 1
+            self.seconds += seconds
+        firestore_calls.inc(endpoint=self.endpoint, method=method)
+        if reads:
+            firestore_reads.inc(reads, endpoint=self.endpoint)
+        if writes:
+            firestore_writes.inc(writes, endpoint=self.endpoint)
+        firestore_seconds.inc(seconds, endpoint=self.endpoint)
+
+
+def current_stats():
+    stats = _current.get()
+    return stats if stats is not None else RequestStats('background')
+
+
+def track(endpoint):
+    # Attribute Firestore calls in the current context to `endpoint`;
+    # returns a token for reset_tracking()
+    return _current.set(RequestStats(endpoint))
+
+
+def reset_tracking(token):
+    _current.reset(token)
+
+
+def add_firestore_observer(callback):
+    # callback(method, started, seconds, reads, writes) runs in the caller's
+    # context after each Firestore call; `started` is a perf_counter() value
+    _observers.append(callback)
+
+
+def _record(stats, method, started, reads=0, writes=0):
+    seconds = time.perf_counter() - started
+    stats.add(method, reads=reads, writes=writes, seconds=seconds)
+    for callback in _observers:
+        try:
+            callback(method, started, seconds, reads, writes)
+        except Exception:
+            pass
+
+
+def _count_reads(method, response):
+    if method == 'batch_get_documents':
+        # Missing documents are billed as reads too
+        return 1 if (response.found or response.missing) else 0
+    if method == 'run_query':
+        return 1 if response.document else 0
+    if method == 'list_documents':
+        return 1
+    return 0
+
+
+def _request_field(args, kwargs, name):
+    request_data = kwargs.get('request') or (args[0] if args else None)
+    if isinstance(request_data, dict):
+        return request_data.get(name)
+    return getattr(request_data, name, None)
+
+
+class _CountingIterator:
+    # Wraps a streaming response: reads are counted as they arrive and the
+    # call's wall time runs until the stream is exhausted, `expected`
+    # documents have arrived, or the caller closes or drops it.
+    # DocumentReference.get() reads one response and never drains the stream.
+    def __init__(self, method, iterator, stats, started, expected=None):
+        self._method = method
+        self._iterator = iter(iterator)
+        self._stats = stats
+        self._started = started
+        self._expected = expected
+        self._reads = 0
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            response = next(self._iterator)
+        except Exception:   # StopIteration included
+            self._finish()
+            raise
+        self._reads += _count_reads(self._method, response)
+        if self._expected is not None and self._reads >= self._expected:
+            self._finish()
+        return response
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        reads = self._reads
+        if self._method in ('run_query', 'run_aggregation_query'):
+            # A query is billed at least one read even when nothing matches
+            reads = max(reads, 1)
+        _record(self._stats, self._method, self._started, reads=reads)
+
+    def close(self):
+        self._finish()
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._iterator, name)
+
+
+def _wrap(api, method):
+    original = getattr(api, method)
+
+    def call(*args, **kwargs):
+        stats = current_stats()
+        started = time.perf_counter()
+        try:
+            result = original(*args, **kwargs)
+        except Exception:
+            _record(stats, method, started)
+            raise
+        if method in READ_METHODS:
+            expected = None
+            if method == 'batch_get_documents':
+                # One response per requested document
+                expected = len(_request_field(args, kwargs, 'documents') or []) or None
+            return _CountingIterator(method, result, stats, started, expected)
+        writes = 0
+        if method == 'commit':
+            writes = len(_request_field(args, kwargs, 'writes') or [])
+        _record(stats, method, started, writes=writes)
+        return result
+
+    setattr(api, method, call)
+
+
+def instrument_firestore(db):
+    # Count every call the client makes through its generated API client.
+    # Snapshot listeners use a separate streaming channel and are not counted.
+    if hasattr(db, 'on_create'):
+        # Created lazily (see datastore.LazyClient): instrument each client as it is made
+        db.on_create(instrument_firestore)
+        return db
+    if hasattr(db, 'set_call_observer'):
+        # The in-memory backend reports its simulated calls itself
+        db.set_call_observer(lambda method, started, reads, writes:
+                             _record(current_stats(), method, started, reads=reads, writes=writes))
+        return db
+    api = db._firestore_api
+    if getattr(api, '_metrics_instrumented', False):
+        return db
+    for method in READ_METHODS + ('commit', 'begin_transaction', 'rollback', 'batch_write'):
+        if hasattr(api, method):
+            _wrap(api, method)
+    api._metrics_instrumented = True
+    return db
+
+
+def init_app(app):
+    # Per-request accounting; in debug mode (or with METRICS_HEADERS=1) the
+    # numbers are also sent back as response headers
+
+    @app.before_request
+    def _start_request_metrics():
+        g._metrics_started = time.perf_counter()
+        g._metrics_token = track(request.endpoint or 'unknown')
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        stats = current_stats()
+        endpoint = stats.endpoint
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        http_latency.observe(elapsed, endpoint=endpoint)
+        firestore_per_request.observe(stats.reads, endpoint=endpoint)
+        if app.debug or os.getenv('METRICS_HEADERS') == '1':
+            response.headers['X-Firestore-Reads'] = str(stats.reads)
+            response.headers['X-Firestore-Writes'] = str(stats.writes)
+            response.headers['X-Firestore-Round-Trips'] = str(stats.round_trips)
+            response.headers['Server-Timing'] = (f'firestore;dur={stats.seconds * 1000:.1f}, '
+                                                 f'total;dur={elapsed * 1000:.1f}')
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # after_request did not run: the view raised
+            endpoint = current_stats().endpoint
+            http_requests.inc(endpoint=endpoint, method=request.method, status=500)
+            http_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            try:
+                reset_tracking(token)
+            except ValueError:
+                pass
+
+
+def metrics_response():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,77 @@
+import os
+import tempfile
+from flask import send_from_directory
+
+# Where uploaded media lives. Only 'local' is built in; another backend
+# (a bucket, a CDN origin) needs the same methods as LocalObjectStore.
+BACKEND = os.getenv('MEDIA_STORE', 'local').lower()
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'media'))
+MEDIA_URL = os.getenv('MEDIA_URL', '/media').rstrip('/')
+
+# Keys are content-addressed, so a stored object never changes
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+
+class LocalObjectStore:
+    """Objects kept as files under ``root`` and served by the app at ``base_url``.
+
+    The interface every store provides: ``put(key, data, content_type)``,
+    ``get(key)``, ``exists(key)``, ``delete(key)`` and ``url(key)``; a store
+    the app serves itself also has ``send(key)``.
+    """
+
+    def __init__(self, root=MEDIA_ROOT, base_url=MEDIA_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid key {key!r}')
+        return path
+
+    def put(self, key, data, content_type=None):
+        # Written to a temporary file and renamed, so readers never see half an object
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return f'{self.base_url}/{key}'
+
+    def send(self, key):
+        response = send_from_directory(self.root, key, max_age=CACHE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+
+
+def create_store():
+    if BACKEND == 'local':
+        return LocalObjectStore()
+    raise ValueError(f'Unknown MEDIA_STORE {BACKEND!r}')
@@ -0,0 +1,94 @@
+import datetime
+import functools
+import os
+from flask import request, session
+from flask_login import current_user
+from provider import metrics
+from provider.http_cache import Representation
+from provider.ttl_cache import TTLCache
+
+# Rendered pages kept per process; each entry holds the HTML and its
+# compressed copies, so this bounds memory to a few times the page size.
+# 0 turns the cache off.
+MAX_PAGES = int(os.getenv('PAGE_CACHE_SIZE', 256))
+
+# Content that is not part of the catalog version (vendor names, review
+# text) is at most this many seconds old
+TTL = int(os.getenv('PAGE_CACHE_TTL', 120))
+
+# Browsers and shared caches may reuse a page this long without asking
+MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', 0))
+
+page_cache_requests = metrics.registry.counter(
+    'page_cache_requests_total', 'Cacheable page requests by outcome (hit, miss, bypass).',
+    ('endpoint', 'result'))
+
+
+class PageCache:
+    """Rendered, pre-compressed HTML of anonymous pages.
+
+    Pages are keyed by endpoint, path, query string and ``version()``, so a
+    catalog change makes every stored page unreachable at once; while
+    ``version()`` returns None (the catalog is not being watched) nothing
+    is cached. A hit is answered without running the view, so it makes no
+    Firestore reads and renders no template, and conditional requests get
+    304. Logged-in users, and visitors with a flash message waiting, always
+    get a fresh render marked private.
+    """
+
+    def __init__(self, app, version, maxsize=MAX_PAGES, ttl=TTL):
+        self.app = app
+        self.version = version
+        self._pages = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _bypass(self):
+        return (request.method not in ('GET', 'HEAD') or current_user.is_authenticated
+                or '_flashes' in session)
+
+    def _key(self):
+        if self._pages.maxsize <= 0:
+            return None
+        version = self.version()
+        if version is None:
+            return None
+        return (request.endpoint, request.path, tuple(sorted(request.args.items(multi=True))), version)
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = None if self._bypass() else self._key()
+            if key is None:
+                page_cache_requests.inc(endpoint=request.endpoint, result='bypass')
+                response = self.app.make_response(view(*args, **kwargs))
+                response.headers.setdefault('Cache-Control', 'private, no-cache')
+                return response
+
+            page = self._pages.get(key)
+            if page is not None:
+                page_cache_requests.inc(endpoint=request.endpoint, result='hit')
+                return self._respond(page)
+
+            page_cache_requests.inc(endpoint=request.endpoint, result='miss')
+            response = self.app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype != 'text/html' or session.modified:
+                # Redirects, errors and anything that touched the session are per visitor
+                response.headers.setdefault('Cache-Control', 'private, no-cache')
+                return response
+            page = Representation(response.get_data(), response.mimetype,
+                                  last_modified=datetime.datetime.now(datetime.timezone.utc))
+            page.precompress()
+            self._pages.set(key, page)
+            return self._respond(page)
+        return wrapper
+
+    def _respond(self, page):
+        response = page.respond(self.app, cache_control=f'public, max-age={MAX_AGE}, must-revalidate')
+        # The same URL is personalised once the visitor logs in
+        response.vary.add('Cookie')
+        return response
+
+    def clear(self):
+        self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
@@ -0,0 +1,76 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from provider.datastore import rpc_deadline
+
+PAGE_SIZE = 24
+
+
+class CursorMismatchError(ValueError):
+    """A cursor issued for a listing ordered by different fields."""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+
+def encode_cursor(values, doc_id):
+    # Opaque, URL-safe token holding the sort values and id of the last
+    # document on a page
+    payload = json.dumps([[_encode_value(v) for v in values], doc_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns (values, doc_id), or None for a missing or malformed token
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [_decode_value(v) for v in values], str(doc_id)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def check_cursor(cursor, value_count):
+    # Raise CursorMismatchError for a cursor that does not hold `value_count`
+    # sort values; a missing or malformed one just starts from the top
+    position = decode_cursor(cursor)
+    if position is not None and len(position[0]) != value_count:
+        raise CursorMismatchError('This cursor belongs to a different listing')
+
+
+def fetch_page(query, order_fields, cursor=None, direction=firestore.Query.ASCENDING, page_size=PAGE_SIZE,
+               timeout=None):
+    # `query` must already be ordered by `order_fields`; the document id is
+    # appended as a tie-breaker so every cursor position is unique. Returns
+    # (documents, next_cursor) where next_cursor is None on the last page.
+    # `timeout` bounds the read itself (see rpc_deadline).
+    query = query.order_by(FieldPath.document_id(), direction=direction)
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        values, doc_id = position
+        if len(values) == len(order_fields):
+            query = query.start_after({**dict(zip(order_fields, values)), '__name__': doc_id})
+
+    docs = list(query.limit(page_size + 1).stream(**rpc_deadline(timeout)))
+    if len(docs) <= page_size:
+        return docs, None
+
+    docs = docs[:page_size]
+    last = docs[-1]
+    next_cursor = encode_cursor([last.get(field) for field in order_fields], last.id)
+    return docs, next_cursor
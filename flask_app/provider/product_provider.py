@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from models import Product
+
+class ProductProvider:
+    """Process-wide catalog cache kept current by Firestore listeners.
+
+    Products and categories are loaded once through ``on_snapshot`` and every
+    later change is applied in place. While the listeners are down, the
+    initial load has not finished or the catalog outgrew ``max_products``,
+    every accessor falls back to reading Firestore directly.
+    """
+
+    RESTART_INTERVAL = 30
+
+    def __init__(self, db, max_products=None):
+        self.db = db
+        self.max_products = max_products or int(os.getenv('CATALOG_CACHE_MAX_PRODUCTS', 50000))
+        self.version = 0
+        self._products = {}
+        self._categories = {}
+        self._lock = threading.RLock()
+        self._watches = []
+        self._loaded = {'products': threading.Event(), 'categories': threading.Event()}
+        self._overflow = False
+        self._started_at = None
+        self._listeners = []
+        self._category_listeners = []
+
+    # Lifecycle
+
+    def start(self):
+        with self._lock:
+            if self._watches and all(watch.is_active for watch in self._watches):
+                return
+            self._stop_watches()
+            self._products.clear()
+            self._categories.clear()
+            self._overflow = False
+            for event in self._loaded.values():
+                event.clear()
+            self._notify('RESET', None, None, None)
+            self._started_at = time.monotonic()
+            # The products watch goes first; _stop_products_watch relies on it
+            self._watches = [
+                self.db.collection('products').on_snapshot(self._on_products),
+                self.db.collection('categories').on_snapshot(self._on_categories),
+            ]
+
+    def stop(self):
+        with self._lock:
+            self._stop_watches()
+
+    def _stop_watches(self):
+        for watch in self._watches:
+            self._unsubscribe(watch)
+        self._watches = []
+
+    def _stop_products_watch(self):
+        watch = self._watches[0] if self._watches else None
+        if watch is None:
+            return
+        self._watches = self._watches[1:]
+        # Called from the watch's own callback thread, which unsubscribe() joins
+        threading.Thread(target=self._unsubscribe, args=(watch,), daemon=True).start()
+
+    @staticmethod
+    def _unsubscribe(watch):
+        try:
+            watch.unsubscribe()
+        except Exception:
+            pass
+
+    def wait_until_loaded(self, timeout=None):
+        self._ensure_started()
+        return all(event.wait(timeout) for event in self._loaded.values())
+
+    def _ensure_started(self):
+        if not self._watches:
+            self.start()
+        elif not all(watch.is_active for watch in self._watches):
+            # Listener dropped; retry now and then, serve direct reads meanwhile
+            if time.monotonic() - self._started_at >= self.RESTART_INTERVAL:
+                self.start()
+
+    @property
+    def available(self):
+        try:
+            self._ensure_started()
+        except Exception:
+            return False
+        return (not self._overflow
+                and all(event.is_set() for event in self._loaded.values())
+                and all(watch.is_active for watch in self._watches))
+
+    def add_listener(self, callback):
+        # callback(change_type, product_id, old_product, new_product) runs on
+        # the listener thread for every product change after it is applied.
+        # A 'RESET' change (ids and products None) means the cache is being
+        # reloaded from scratch and every product will be sent again.
+        self._listeners.append(callback)
+
+    def add_category_listener(self, callback):
+        # callback() runs on the listener thread after category changes are applied
+        self._category_listeners.append(callback)
+
+    def _notify(self, change_type, product_id, old, new):
+        for callback in self._listeners:
+            try:
+                callback(change_type, product_id, old, new)
+            except Exception:
+                # A broken listener must not take the cache down with it
+                pass
+
+    # Snapshot callbacks
+
+    def _on_products(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                old = self._products.get(doc.id)
+                if self._overflow:
+                    continue
+                if change.type.name == 'REMOVED':
+                    self._products.pop(doc.id, None)
+                    new = None
+                else:
+                    new = Product.from_snapshot(doc)
+                    self._products[doc.id] = new
+                self.version += 1
+                self._notify(change.type.name, doc.id, old, new)
+            if not self._overflow and len(self._products) > self.max_products:
+                # Too big to hold in memory; drop it and read through instead.
+                # The watch keeps its own copy of every document, so it goes
+                # too, and listeners are told to drop theirs.
+                self._overflow = True
+                self._products.clear()
+                self._stop_products_watch()
+                self._notify('RESET', None, None, None)
+            self._loaded['products'].set()
+
+    def _on_categories(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    self._categories.pop(doc.id, None)
+                else:
+                    self._categories[doc.id] = {'id': doc.id, **doc.to_dict()}
+                self.version += 1
+            self._loaded['categories'].set()
+            if changes:
+                for callback in self._category_listeners:
+                    try:
+                        callback()
+                    except Exception:
+                        pass
+
+    # Accessors
+
+    def all_products(self):
+        if self.available:
+            with self._lock:
+                return list(self._products.values())
+        return [Product.from_snapshot(doc)
+                for doc in self.db.collection('products').select(Product.LISTING_FIELDS).stream()]
+
+    def get_product(self, product_id):
+        if self.available:
+            return self._products.get(product_id)
+        doc = self.db.collection('products').document(product_id).get()
+        return Product.from_snapshot(doc) if doc.exists else None
+
+    def get_products(self, product_ids):
+        # Products for the given ids, in that order, skipping missing ones
+        products = (self.get_product(product_id) for product_id in product_ids)
+        return [product for product in products if product is not None]
+
+    def featured_products(self, limit=8):
+        if self.available:
+            with self._lock:
+                return [p for p in self._products.values() if p.is_featured][:limit]
+        return [Product.from_snapshot(doc)
+                for doc in self.db.collection('products')
+                .where('is_featured', '==', True)
+                .select(Product.LISTING_FIELDS)
+                .limit(limit)
+                .stream()]
+
+    def products_in_category(self, category_name):
+        if self.available:
+            with self._lock:
+                return [p for p in self._products.values() if p.category == category_name]
+        return [Product.from_snapshot(doc)
+                for doc in self.db.collection('products')
+                .where('category', '==', category_name)
+                .select(Product.LISTING_FIELDS)
+                .stream()]
+
+    def categories(self):
+        if self.available:
+            with self._lock:
+                return list(self._categories.values())
+        return [{'id': doc.id, **doc.to_dict()} for doc in self.db.collection('categories').stream()]
@@ -0,0 +1,55 @@
+import heapq
+import threading
+
+RELATED_LIMIT = 4
+
+
+def _rank_key(product):
+    # Best rated first, then most reviewed, then id for a stable order
+    return (product.rating, product.review_count, product.id)
+
+
+class RelatedIndex:
+    """Top in-stock products per category, ready to serve as "related items".
+
+    Each category keeps its best ``limit + 1`` products precomputed, so a
+    lookup is a dict get plus dropping the product being viewed. Feed it
+    through ``on_product_change`` (a ``ProductProvider`` listener).
+    """
+
+    def __init__(self, limit=RELATED_LIMIT):
+        self.limit = limit
+        self._members = {}   # category -> {product_id: product}
+        self._top = {}   # category -> [product, ...] best first
+        self._lock = threading.Lock()
+
+    def on_product_change(self, change_type, product_id, old, new):
+        with self._lock:
+            if change_type == 'RESET':
+                self._members.clear()
+                self._top.clear()
+                return
+            touched = set()
+            if old is not None:
+                category = old.category
+                if self._members.get(category, {}).pop(product_id, None) is not None:
+                    touched.add(category)
+            if new is not None and new.stock > 0:
+                category = new.category
+                self._members.setdefault(category, {})[product_id] = new
+                touched.add(category)
+            for category in touched:
+                self._refresh(category)
+
+    def _refresh(self, category):
+        members = self._members.get(category)
+        if not members:
+            self._members.pop(category, None)
+            self._top.pop(category, None)
+            return
+        self._top[category] = heapq.nlargest(self.limit + 1, members.values(), key=_rank_key)
+
+    def related(self, product_id, category, limit=None):
+        limit = limit or self.limit
+        top = self._top.get(category, [])
+        return [product for product in top if product.id != product_id][:limit]
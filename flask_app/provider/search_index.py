@@ -0,0 +1,160 @@
+import bisect
+import heapq
+import itertools
+import re
+import threading
+
+# Relative weight of a token match in each searchable field
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'brand': 2.0,
+    'category': 1.0,
+}
+
+# A prefix hit ("sne" -> "sneakers") counts for less than a whole-token hit
+PREFIX_FACTOR = 0.5
+
+# Shorter query tokens only match whole tokens; a one-letter prefix would
+# pull in most of the catalog
+MIN_PREFIX_LENGTH = 2
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text or '').lower())
+
+
+class SearchIndex:
+    """Tokenized inverted index over the product catalog.
+
+    Each token maps to the products containing it and the weight it carries
+    there. Tokens are also kept in a sorted list so prefix lookups are a
+    bisect plus a short scan. Feed it through ``on_product_change`` (a
+    ``ProductProvider`` listener) to keep it in step with the catalog.
+    """
+
+    def __init__(self):
+        self._postings = {}   # token -> {product_id: weight}
+        self._doc_tokens = {}   # product_id -> {token: weight}
+        self._names = {}   # product_id -> lower-cased name, for stable ordering
+        self._tokens = []   # sorted list of every indexed token
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    # Maintenance
+
+    def add(self, product):
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(product, field)):
+                weights[token] = max(weights.get(token, 0.0), field_weight)
+
+        with self._lock:
+            self._remove(product.id)
+            for token, weight in weights.items():
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    bisect.insort(self._tokens, token)
+                posting[product.id] = weight
+            self._doc_tokens[product.id] = weights
+            self._names[product.id] = product.name.lower()
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        for token in self._doc_tokens.pop(product_id, {}):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self._postings[token]
+                index = bisect.bisect_left(self._tokens, token)
+                if index < len(self._tokens) and self._tokens[index] == token:
+                    del self._tokens[index]
+        self._names.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_tokens.clear()
+            self._names.clear()
+            self._tokens = []
+
+    def rebuild(self, products):
+        with self._lock:
+            self.clear()
+            for product in products:
+                self.add(product)
+
+    def on_product_change(self, change_type, product_id, old, new):
+        if change_type == 'RESET':
+            self.clear()
+        elif new is None:
+            self.remove(product_id)
+        else:
+            self.add(new)
+
+    # Lookup
+
+    def _match(self, query_token):
+        # Best weight per product for one query token, exact or by prefix
+        scores = dict(self._postings.get(query_token, {}))
+        if len(query_token) < MIN_PREFIX_LENGTH:
+            return scores
+        start = bisect.bisect_right(self._tokens, query_token)
+        for token in itertools.islice(self._tokens, start, None):
+            if not token.startswith(query_token):
+                break
+            for product_id, weight in self._postings[token].items():
+                score = weight * PREFIX_FACTOR
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+    def search(self, query, page=1, limit=24):
+        # Returns (total_matches, [product_id, ...]) for the requested page.
+        # Every query token has to match; scores add up across tokens.
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return 0, []
+
+        with self._lock:
+            # Narrowest token first so the intersection shrinks fast
+            matches = sorted((self._match(token) for token in query_tokens), key=len)
+            scores = dict(matches[0])
+            for token_scores in matches[1:]:
+                scores = {product_id: score + token_scores[product_id]
+                          for product_id, score in scores.items()
+                          if product_id in token_scores}
+                if not scores:
+                    break
+            ranked = self._rank(scores, (page - 1) * limit, limit)
+        return len(scores), ranked
+
+    def _rank(self, scores, offset, limit):
+        # Scores take only a handful of distinct values, so bucket by score
+        # and sort (by name) only the buckets that reach the requested page
+        buckets = {}
+        for product_id, score in scores.items():
+            buckets.setdefault(score, []).append(product_id)
+
+        ranked = []
+        wanted = offset + limit
+        for score in sorted(buckets, reverse=True):
+            bucket = buckets[score]
+            remaining = wanted - len(ranked)
+            if len(bucket) > remaining:
+                bucket = heapq.nsmallest(remaining, bucket, key=lambda pid: (self._names.get(pid, ''), pid))
+            else:
+                bucket.sort(key=lambda pid: (self._names.get(pid, ''), pid))
+            ranked.extend(bucket)
+            if len(ranked) >= wanted:
+                break
+        return ranked[offset:wanted]
@@ -0,0 +1,57 @@
+import logging
+import os
+import threading
+import time
+
+# Startup timings, in seconds since this module was first imported (app.py
+# imports it before anything else) or, in a forked worker, since the fork.
+# Each phase is recorded once per process:
+#   app_imported    app.py finished importing
+#   app_created     create_app() returned
+#   client_ready    the database client was created
+#   first_request   the first request finished
+PHASES = ('app_imported', 'app_created', 'client_ready', 'first_request')
+
+logger = logging.getLogger(__name__)
+
+_origin = time.perf_counter()
+_phases = {}
+_lock = threading.Lock()
+
+
+def _after_fork():
+    global _origin
+    _origin = time.perf_counter()
+    _phases.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def mark(phase):
+    # Record the first time `phase` is reached in this process
+    with _lock:
+        if phase in _phases:
+            return False
+        _phases[phase] = time.perf_counter() - _origin
+        return True
+
+
+def timings():
+    with _lock:
+        return {phase: round(seconds, 4) for phase, seconds in _phases.items()}
+
+
+def init_app(app):
+    from provider import metrics
+    for phase in PHASES:
+        metrics.registry.gauge(f'startup_{phase}_seconds',
+                               f'Seconds from process start (or fork) until {phase.replace("_", " ")}.',
+                               lambda phase=phase: timings()[phase])
+
+    @app.after_request
+    def _mark_first_request(response):
+        if 'first_request' not in _phases and mark('first_request'):
+            app.logger.info('Startup: ' + ', '.join(f'{phase} {seconds:.3f}s'
+                                                    for phase, seconds in timings().items()))
+        return response
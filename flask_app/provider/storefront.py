@@ -0,0 +1,189 @@
+import datetime
+import os
+import threading
+import time
+from google.cloud import firestore
+from models import Product
+from provider.category_counts import get_category_counts, rebuild_category_counts
+
+# Everything the home page shows, precomputed into one document:
+#   stats/storefront = {'categories': [tile, ...], 'featured': [card, ...],
+#                       'products': [card, ...], 'nextCursor': ..., 'updatedAt': ...}
+STOREFRONT_COLLECTION = 'stats'
+STOREFRONT_DOCUMENT = 'storefront'
+
+SECTIONS = ('categories', 'featured', 'products')
+FEATURED_LIMIT = 8
+
+# Catalog changes are coalesced: the first one schedules a rebuild this many
+# seconds later and any that follow are folded into it
+DEBOUNCE_SECONDS = float(os.getenv('STOREFRONT_DEBOUNCE', 2))
+
+# While the catalog listener is down nothing reports changes, so a copy
+# older than this is rebuilt on the next request
+MAX_AGE = float(os.getenv('STOREFRONT_MAX_AGE', 300))
+
+
+def storefront_ref(db):
+    return db.collection(STOREFRONT_COLLECTION).document(STOREFRONT_DOCUMENT)
+
+
+def _card(product):
+    # The fields a product card needs, plus what decides its place on the page
+    data = product.to_dict()
+    card = {field: data.get(field) for field in Product.LISTING_FIELDS}
+    card.update(productId=product.id, is_featured=product.is_featured, createdAt=product.created_at)
+    return card
+
+
+class Storefront:
+    """Materialized home page, rebuilt in the background as the catalog changes.
+
+    Register ``on_product_change`` and ``on_category_change`` with the
+    ProductProvider. Each change marks only the sections it can affect (category
+    tiles, featured list, first product page); those are recomputed after a
+    short debounce and merged into the stored document and the in-process copy.
+    """
+
+    def __init__(self, db, catalog, first_page, debounce=DEBOUNCE_SECONDS):
+        self.db = db
+        self.catalog = catalog
+        # Callable returning (products, next_cursor) for the newest-first listing
+        self.first_page = first_page
+        self.debounce = debounce
+        self._data = None
+        self._built_at = 0
+        # Bumped whenever the in-process copy is replaced
+        self.version = 0
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    # Change tracking
+
+    def on_product_change(self, change_type, product_id, old, new):
+        if change_type == 'RESET':
+            self.mark_dirty(*SECTIONS)
+            return
+        sections = set()
+        if (old is not None and old.is_featured) or (new is not None and new.is_featured):
+            sections.add('featured')
+        if (old.category if old else None) != (new.category if new else None):
+            sections.add('categories')
+        if self._on_first_page(product_id, new):
+            sections.add('products')
+        if sections:
+            self.mark_dirty(*sections)
+
+    def on_category_change(self):
+        self.mark_dirty('categories')
+
+    def _on_first_page(self, product_id, new):
+        data = self._data
+        if data is None:
+            return True
+        cards = data.get('products', [])
+        if any(card.get('productId') == product_id for card in cards):
+            return True
+        if new is None or new.created_at is None:
+            return False
+        if not data.get('nextCursor') or not cards:
+            # The whole catalog fits on the first page
+            return True
+        try:
+            return new.created_at >= cards[-1].get('createdAt')
+        except TypeError:
+            return True
+
+    def mark_dirty(self, *sections):
+        with self._lock:
+            self._dirty.update(sections)
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            sections, self._dirty = self._dirty, set()
+            self._timer = None
+        try:
+            self.rebuild(sections)
+        except Exception:
+            # Try again after the next debounce interval
+            self.mark_dirty(*sections)
+
+    # Building
+
+    def _category_tiles(self):
+        counts = get_category_counts(self.db)
+        if counts is None:
+            counts = rebuild_category_counts(self.db)
+        return [{
+            'id': category['id'],
+            'name': category.get('categoryName', ''),
+            'icon': category.get('icon', 'shopping-bag'),
+            'imageUrl': category.get('image', 'https://via.placeholder.com/300x200?text=Category'),
+            'product_count': counts.get(category.get('categoryName', ''), 0)
+        } for category in self.catalog.categories()]
+
+    def rebuild(self, sections=SECTIONS):
+        # Recompute the given sections (all of them when there is nothing to
+        # merge into yet), store them and swap in the new in-process copy
+        with self._build_lock:
+            current = self._data or {}
+            if not all(section in current for section in SECTIONS):
+                sections = SECTIONS
+            update = {}
+            if 'categories' in sections:
+                update['categories'] = self._category_tiles()
+            if 'featured' in sections:
+                update['featured'] = [_card(p) for p in self.catalog.featured_products(limit=FEATURED_LIMIT)]
+            if 'products' in sections:
+                products, next_cursor = self.first_page()
+                update['products'] = [_card(p) for p in products]
+                update['nextCursor'] = next_cursor
+            if not update:
+                return current
+            storefront_ref(self.db).set({**update, 'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+            data = {**current, **update, 'updatedAt': datetime.datetime.now(datetime.timezone.utc)}
+            with self._lock:
+                self._data = data
+                self._built_at = time.monotonic()
+                self.version += 1
+            return data
+
+    # Reading
+
+    def current(self):
+        # The storefront document: the in-process copy while it is kept
+        # current, else the stored document, else a fresh build
+        with self._lock:
+            data, built_at = self._data, self._built_at
+        if data is not None and (self.catalog.available or time.monotonic() - built_at < MAX_AGE):
+            return data
+
+        if data is None:
+            doc = storefront_ref(self.db).get()
+            stored = doc.to_dict() if doc.exists else {}
+            updated_at = stored.get('updatedAt')
+            if (all(section in stored for section in SECTIONS) and updated_at is not None
+                    and (datetime.datetime.now(datetime.timezone.utc) - updated_at).total_seconds() < MAX_AGE):
+                with self._lock:
+                    if self._data is None:
+                        self._data = stored
+                        self._built_at = time.monotonic()
+                        self.version += 1
+                    return self._data
+        return self.rebuild()
+
+    def context(self):
+        # Template variables for customer/home.html
+        data = self.current()
+        return {
+            'categories': data.get('categories', []),
+            'featured_products': [Product.from_dict(card) for card in data.get('featured', [])],
+            'all_products': [Product.from_dict(card) for card in data.get('products', [])],
+            'next_cursor': data.get('nextCursor'),
+        }
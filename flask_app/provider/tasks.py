@@ -0,0 +1,291 @@
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from provider import metrics
+
+# Worker threads, and how many tasks may be queued or running at once. When
+# the queue is full (or draining) a task runs inline in the caller instead.
+WORKERS = int(os.getenv('TASK_WORKERS', 4))
+CAPACITY = int(os.getenv('TASK_QUEUE_SIZE', 1000))
+
+# Attempts per task; retry n waits about BACKOFF * 2**(n-1) seconds
+MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 5))
+BACKOFF = float(os.getenv('TASK_BACKOFF', 0.5))
+MAX_BACKOFF = 60
+
+# Every accepted task is written here until it finishes, so tasks lost in a
+# crash run again on the next start; tasks that exhaust their attempts (or
+# fail when run inline on overflow) are moved to failed/
+SPOOL_DIR = os.getenv('TASK_SPOOL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                     'spool', 'tasks'))
+
+# How long shutdown waits for queued tasks
+DRAIN_TIMEOUT = float(os.getenv('TASK_DRAIN_TIMEOUT', 10))
+
+logger = logging.getLogger(__name__)
+
+# name -> function(db, *args, **kwargs); see task()
+_registry = {}
+_db = None
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+_owner_id = None
+_owner_pid = None
+
+task_latency = metrics.registry.histogram(
+    'task_latency_seconds', 'Time from enqueue to completion of background tasks, by task.',
+    ('task',), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+task_duration = metrics.registry.histogram(
+    'task_duration_seconds', 'Time spent running background tasks (all attempts), by task.', ('task',))
+task_results = metrics.registry.counter(
+    'tasks_total', 'Background tasks finished, by task and outcome.', ('task', 'outcome'))
+task_overflow = metrics.registry.counter(
+    'task_overflow_total', 'Tasks run inline because the queue was full or draining, by task.', ('task',))
+task_retries = metrics.registry.counter(
+    'task_retries_total', 'Background task attempts that failed and were retried, by task.', ('task',))
+
+
+def task(name):
+    # Register a function as a background task. It is called as
+    # fn(db, *args, **kwargs) with the JSON-serializable arguments given to
+    # enqueue(), possibly more than once, so it must be idempotent.
+    def decorator(fn):
+        _registry[name] = fn
+        return fn
+    return decorator
+
+
+class TaskQueue:
+    """Bounded in-process queue of registered tasks, run on a thread pool."""
+
+    def __init__(self, db, workers=WORKERS, capacity=CAPACITY, spool_dir=SPOOL_DIR,
+                 max_attempts=MAX_ATTEMPTS, backoff=BACKOFF):
+        self.db = db
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task')
+        self._slots = threading.BoundedSemaphore(capacity)
+        self._depth = 0
+        self._idle = threading.Condition()
+        self._closing = threading.Event()
+        os.makedirs(os.path.join(spool_dir, 'failed'), exist_ok=True)
+
+    @property
+    def depth(self):
+        # Tasks accepted and not yet finished
+        return self._depth
+
+    def enqueue(self, name, *args, **kwargs):
+        if name not in _registry:
+            raise KeyError(f'Unknown task {name!r}')
+        record = {'id': uuid.uuid4().hex, 'name': name, 'args': list(args), 'kwargs': kwargs,
+                  'enqueuedAt': time.time()}
+        if self._closing.is_set() or not self._slots.acquire(blocking=False):
+            # No room: do the work now rather than drop it, once, so the
+            # request doesn't sit through the retry backoff. A failure is
+            # logged and kept in failed/, never raised into the request.
+            task_overflow.inc(task=name)
+            try:
+                self._execute(record, attempts=1)
+            except Exception as e:
+                logger.error(f"Task {name} {record['id']} failed when run inline: {e}")
+                self._spool(record, failed=True)
+            return record['id']
+        self._spool(record)
+        self._submit(record)
+        return record['id']
+
+    def _submit(self, record):
+        with self._idle:
+            self._depth += 1
+        self._executor.submit(self._run, record)
+
+    def _run(self, record):
+        try:
+            self._execute(record)
+            self._unspool(record)
+        except Exception as e:
+            logger.error(f"Task {record['name']} {record['id']} failed after {self.max_attempts} attempts: {e}")
+            self._unspool(record, failed=True)
+        finally:
+            self._slots.release()
+            with self._idle:
+                self._depth -= 1
+                self._idle.notify_all()
+
+    def _execute(self, record, attempts=None):
+        name = record['name']
+        attempts = attempts or self.max_attempts
+        fn = _registry[name]
+        started = time.perf_counter()
+        token = metrics.track(f'task:{name}')
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    fn(self.db, *record['args'], **record['kwargs'])
+                except Exception:
+                    if attempt == attempts:
+                        task_results.inc(task=name, outcome='failed')
+                        raise
+                    task_retries.inc(task=name)
+                    delay = min(self.backoff * 2 ** (attempt - 1), MAX_BACKOFF)
+                    # Jittered so a burst of failures doesn't retry in lockstep;
+                    # cut short when shutting down
+                    self._closing.wait(delay * random.uniform(0.5, 1.0))
+                    continue
+                task_results.inc(task=name, outcome='ok')
+                return
+        finally:
+            metrics.reset_tracking(token)
+            task_duration.observe(time.perf_counter() - started, task=name)
+            task_latency.observe(max(time.time() - record['enqueuedAt'], 0), task=name)
+
+    # Spool
+
+    def _spool_path(self, record):
+        return os.path.join(self.spool_dir, f"{record['id']}.{_owner()}.json")
+
+    def _spool(self, record, failed=False):
+        path = self._spool_path(record)
+        if failed:
+            path = os.path.join(self.spool_dir, 'failed', os.path.basename(path))
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(record, f, default=str)
+        os.replace(path + '.tmp', path)
+
+    def _unspool(self, record, failed=False):
+        path = self._spool_path(record)
+        try:
+            if failed:
+                os.replace(path, os.path.join(self.spool_dir, 'failed', os.path.basename(path)))
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def recover(self):
+        # Re-enqueue tasks spooled by processes that are no longer running
+        # (this one included, from before a restart). Returns how many.
+        recovered = 0
+        for filename in sorted(os.listdir(self.spool_dir)):
+            parts = filename.split('.')
+            if len(parts) != 3 or parts[2] != 'json':
+                continue
+            owner = parts[1]
+            if owner != _owner() and _owner_alive(owner):
+                continue
+            path = os.path.join(self.spool_dir, filename)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    record = json.load(f)
+                # Claim it: the rename fails if another process got there first
+                os.replace(path, self._spool_path(record))
+            except (OSError, ValueError):
+                continue
+            if record.get('name') not in _registry:
+                logger.warning(f"Spooled task {record.get('id')} has unknown name {record.get('name')!r}")
+                self._unspool(record, failed=True)
+                continue
+            self._slots.acquire()
+            self._submit(record)
+            recovered += 1
+        return recovered
+
+    # Shutdown
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        # Stop accepting work and wait for queued tasks; whatever is still
+        # pending after `timeout` stays in the spool for the next start.
+        # Returns True when the queue emptied.
+        self._closing.set()
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._depth:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            drained = not self._depth
+        self._executor.shutdown(wait=drained, cancel_futures=not drained)
+        return drained
+
+
+def _start_time(pid):
+    # When the process started, in clock ticks since boot (Linux); None
+    # where /proc isn't available
+    try:
+        with open(f'/proc/{pid}/stat', encoding='utf-8') as f:
+            # The command name may contain spaces; the fields after it don't
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _owner():
+    # Spool file owner: this process's pid plus its start time, since pids
+    # are reused (in containers, restarted workers get the same small ones)
+    global _owner_id, _owner_pid
+    pid = os.getpid()
+    if _owner_pid != pid:
+        start = _start_time(pid)
+        _owner_id, _owner_pid = (f'{pid}-{start}' if start else str(pid)), pid
+    return _owner_id
+
+
+def _owner_alive(owner):
+    pid, _, start = owner.partition('-')
+    if not pid.isdigit():
+        return False
+    if start:
+        return _start_time(int(pid)) == start
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def enqueue(db, name, *args, **kwargs):
+    # Run a registered task in the background; without a queue (CLI
+    # commands, scripts) it runs right away against `db`
+    if _db is None:
+        _registry[name](db, *args, **kwargs)
+        return None
+    return queue().enqueue(name, *args, **kwargs)
+
+
+def queue():
+    # This process's queue, started on first use: a forked worker gets its
+    # own threads, and recovers what is left in the spool
+    global _queue, _queue_pid
+    if _queue is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue_pid != os.getpid():
+                started = TaskQueue(_db)
+                _queue, _queue_pid = started, os.getpid()
+                atexit.register(started.drain)
+                recovered = started.recover()
+                if recovered:
+                    logger.info(f'Recovered {recovered} spooled background tasks')
+    return _queue
+
+
+def init_app(app, db):
+    global _db
+    _db = db
+    metrics.registry.gauge('task_queue_depth', 'Background tasks queued or running.',
+                           lambda: _queue.depth if _queue is not None else 0)
+
+    @app.before_request
+    def _start_task_queue():
+        queue()
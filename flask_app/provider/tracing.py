@@ -0,0 +1,266 @@
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+from flask import g, request, before_render_template, template_rendered
+from provider import metrics
+
+# Fraction of requests traced; a request sent with "X-Trace: 1" is always traced
+SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+FORCE_HEADER = 'X-Trace'
+
+# Finished traces, one JSON object per line, rotated by size
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                  'traces', 'traces.jsonl'))
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', 10 * 1024 * 1024))
+TRACE_BACKUP_COUNT = int(os.getenv('TRACE_BACKUP_COUNT', 5))
+
+# Endpoints never worth tracing
+SKIP_ENDPOINTS = ('static', 'media', 'metrics_endpoint')
+
+_trace = contextvars.ContextVar('trace', default=None)
+_parent = contextvars.ContextVar('trace_parent', default=None)
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Trace:
+    """Spans recorded while handling one request."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def add(self, span_id, name, kind, parent, started, seconds, attrs=None):
+        with self._lock:
+            self.spans.append({
+                'id': span_id,
+                'parent': parent,
+                'name': name,
+                'kind': kind,
+                'start_ms': round((started - self.started) * 1000, 3),
+                'duration_ms': round(seconds * 1000, 3),
+                'attrs': attrs or {},
+            })
+
+
+class Span:
+    def __init__(self, trace, name, kind, attrs):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.id = trace.next_id()
+        self.parent = None
+        self._token = None
+
+    def __enter__(self):
+        self.parent = _parent.get()
+        self._token = _parent.set(self.id)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        _parent.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.trace.add(self.id, self.name, self.kind, self.parent, self.started, seconds, self.attrs)
+        return False
+
+
+def current_trace():
+    return _trace.get()
+
+
+def span(name, kind='internal', **attrs):
+    # No-op unless the current request is being traced
+    trace = _trace.get()
+    if trace is None:
+        return contextlib.nullcontext()
+    return Span(trace, name, kind, attrs)
+
+
+def traced(name, kind='internal'):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_functions(module, names, kind):
+    # Trace calls made through `module.<name>`; spans are named '<kind>.<name>'
+    for name in names:
+        fn = getattr(module, name, None)
+        if fn is not None and not getattr(fn, '_traced', False):
+            wrapper = traced(f'{kind}.{name}', kind)(fn)
+            wrapper._traced = True
+            setattr(module, name, wrapper)
+
+
+def _on_firestore_call(method, started, seconds, reads, writes):
+    trace = _trace.get()
+    if trace is None:
+        return
+    attrs = {}
+    if reads:
+        attrs['reads'] = reads
+    if writes:
+        attrs['writes'] = writes
+    trace.add(trace.next_id(), f'firestore.{method}', 'firestore', _parent.get(), started, seconds, attrs)
+
+
+def _get_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+            handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES,
+                                          backupCount=TRACE_BACKUP_COUNT, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger('traces')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+def _write(record):
+    _get_logger().info(json.dumps(record, separators=(',', ':'), default=str))
+
+
+def _trace_files():
+    # Newest first: the live file, then its rotated backups
+    files = [TRACE_FILE] + [f'{TRACE_FILE}.{i}' for i in range(1, TRACE_BACKUP_COUNT + 1)]
+    return [path for path in files if os.path.exists(path)]
+
+
+def _records():
+    for path in _trace_files():
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+        for line in reversed(lines):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def recent_traces(limit=100):
+    # Summaries of the most recent traces, newest first
+    summaries = []
+    for record in _records():
+        summaries.append({key: record.get(key) for key in
+                          ('id', 'endpoint', 'method', 'path', 'status', 'timestamp', 'duration_ms')}
+                         | {'span_count': len(record.get('spans', []))})
+        if len(summaries) >= limit:
+            break
+    return summaries
+
+
+def find_trace(trace_id):
+    for record in _records():
+        if record.get('id') == trace_id:
+            return record
+    return None
+
+
+def waterfall(record):
+    # Spans in tree order (each parent followed by its children, by start
+    # time) with their depth, for rendering
+    children = {}
+    for item in record.get('spans', []):
+        children.setdefault(item.get('parent'), []).append(item)
+    rows = []
+
+    def visit(parent, depth):
+        for item in sorted(children.get(parent, []), key=lambda s: s['start_ms']):
+            rows.append({**item, 'depth': depth})
+            visit(item['id'], depth + 1)
+
+    visit(None, 0)
+    return rows
+
+
+def init_app(app):
+    metrics.add_firestore_observer(_on_firestore_call)
+
+    @before_render_template.connect_via(app)
+    def _start_template_span(sender, template, context, **extra):
+        trace = _trace.get()
+        if trace is None:
+            return
+        current = Span(trace, f'render {template.name}', 'template', {})
+        current.__enter__()
+        g.setdefault('_template_spans', []).append(current)
+
+    @template_rendered.connect_via(app)
+    def _end_template_span(sender, template, context, **extra):
+        spans = g.get('_template_spans')
+        if spans:
+            spans.pop().__exit__(None, None, None)
+
+    @app.before_request
+    def _start_trace():
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        if request.headers.get(FORCE_HEADER) != '1' and random.random() >= SAMPLE_RATE:
+            return
+        trace = Trace(request.endpoint or 'unknown')
+        g._trace_token = _trace.set(trace)
+
+    @app.after_request
+    def _tag_response(response):
+        trace = _trace.get()
+        if trace is not None:
+            g._trace_status = response.status_code
+            response.headers['X-Trace-Id'] = trace.id
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        token = g.pop('_trace_token', None)
+        if token is None:
+            return
+        trace = _trace.get()
+        try:
+            _trace.reset(token)
+        except ValueError:
+            pass
+        if trace is None:
+            return
+        try:
+            _write({
+                'id': trace.id,
+                'endpoint': trace.name,
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': g.pop('_trace_status', 500),
+                'timestamp': trace.timestamp,
+                'duration_ms': round((time.perf_counter() - trace.started) * 1000, 3),
+                'spans': trace.spans,
+            })
+        except Exception as e:
+            app.logger.warning(f'Could not write trace {trace.id}: {e}')
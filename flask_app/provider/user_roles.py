@@ -0,0 +1,120 @@
+import datetime
+import time
+from google.cloud import firestore
+from provider import tasks
+from provider.datastore import create_auth
+from provider.documents import get_document, get_many_by_collection
+from provider.ttl_cache import TTLCache
+
+# One small document per user, {'role': ..., 'email': ..., 'revokedAt': ...},
+# so a cache miss costs a single read instead of probing every role
+# collection in turn. Sessions issued before `revokedAt` are no longer valid.
+ROLE_DIRECTORY = 'userRoles'
+ROLE_COLLECTIONS = (('buyers', 'buyer'), ('vendors', 'vendor'), ('couriers', 'courier'), ('admins', 'admin'))
+
+# Accounts that sign in with the app's own credentials rather than Firebase Auth
+LOCAL_ACCOUNTS = ('admin',)
+
+# How long this process trusts a resolved identity before checking the
+# directory entry and the Firebase Auth account again, so role changes,
+# revocations and disabled accounts are seen by every worker within it
+IDENTITY_CHECK_INTERVAL = 60
+SESSION_KEY = '_user_identity'
+
+_identity_cache = TTLCache(maxsize=10000, ttl=IDENTITY_CHECK_INTERVAL)
+
+
+def set_user_role(db, uid, role, email, batch=None):
+    # Record (or change) a user's role in the directory; pass `batch` to
+    # commit it together with the profile write
+    ref = db.collection(ROLE_DIRECTORY).document(uid)
+    data = {'role': role, 'email': email, 'updatedAt': firestore.SERVER_TIMESTAMP}
+    if batch is not None:
+        batch.set(ref, data, merge=True)
+    else:
+        ref.set(data, merge=True)
+    _identity_cache.pop(uid)
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime.datetime) else 0
+
+
+def _account_active(uid):
+    # False when the user's Firebase Auth account is deleted or disabled
+    if uid in LOCAL_ACCOUNTS:
+        return True
+    user = create_auth().find_user(uid)
+    return user is not None and not user.disabled
+
+
+def resolve_user(db, uid, issued_at=None):
+    # Returns (role, email) from the role directory, falling back to the
+    # role collections for users created before it existed, or None. Also
+    # None for a disabled or deleted account, and for a session issued (at
+    # `issued_at`) before the user's sessions were revoked.
+    directory_doc = get_document(db.collection(ROLE_DIRECTORY).document(uid))
+    data = directory_doc.to_dict() if directory_doc.exists else {}
+    if issued_at is not None and _timestamp(data.get('revokedAt')) > issued_at:
+        return None
+    if data.get('role'):
+        if not _account_active(uid):
+            return None
+        return data['role'], data.get('email')
+
+    # Probe every role collection in one round trip, then backfill the
+    # directory in the background
+    found = get_many_by_collection(db, {collection: [uid] for collection, _ in ROLE_COLLECTIONS})
+    for collection, role in ROLE_COLLECTIONS:
+        if uid in found[collection]:
+            if not _account_active(uid):
+                return None
+            email = found[collection][uid].get('email') or create_auth().get_user(uid).email
+            tasks.enqueue(db, 'user_roles.set_role', uid, role, email)
+            return role, email
+    return None
+
+
+@tasks.task('user_roles.set_role')
+def _set_role_task(db, uid, role, email):
+    set_user_role(db, uid, role, email)
+
+
+def cached_identity(session, uid):
+    # (role, email) this process confirmed for this very session within the
+    # last IDENTITY_CHECK_INTERVAL, without touching the network; else None.
+    # Entries are per session, so an older, revoked session of the same user
+    # is not carried along by a newer one.
+    issued_at = session_issued_at(session, uid)
+    if issued_at is None:
+        return None
+    identity = _identity_cache.get(uid)
+    if identity is None or identity[0] != issued_at:
+        return None
+    return identity[1]
+
+
+def session_issued_at(session, uid):
+    # When the session's identity was last confirmed, for resolve_user()
+    stored = session.get(SESSION_KEY)
+    if not stored or stored.get('uid') != uid:
+        return None
+    return stored.get('at', 0)
+
+
+def remember_identity(session, uid, role, email):
+    issued_at = time.time()
+    _identity_cache.set(uid, (issued_at, (role, email)))
+    session[SESSION_KEY] = {'uid': uid, 'role': role, 'email': email, 'at': issued_at}
+
+
+def forget_identity(session, uid):
+    session.pop(SESSION_KEY, None)
+    _identity_cache.pop(uid)
+
+
+def revoke_sessions(db, uid):
+    # Sign the user out everywhere: every worker refuses sessions issued
+    # before now at its next check of the directory entry
+    db.collection(ROLE_DIRECTORY).document(uid).set({'revokedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+    _identity_cache.pop(uid)
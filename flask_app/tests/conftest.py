@@ -0,0 +1,15 @@
+import os
+import sys
+
+# The tests run against the in-memory backend; it has to be chosen before
+# provider.datastore is imported
+os.environ['DATA_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from provider.memory_store import MemoryClient
+
+
+@pytest.fixture
+def db():
+    return MemoryClient()
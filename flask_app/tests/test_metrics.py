@@ -0,0 +1,75 @@
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1.types import BatchGetDocumentsResponse, Document
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from provider import metrics
+
+
+class StubFirestoreApi:
+    # Stands in for the generated API client; answers batch_get_documents
+    # with one found document per requested path
+    def __init__(self):
+        self.closed = False
+
+    def batch_get_documents(self, request, metadata=None, **kwargs):
+        def responses():
+            try:
+                for path in request['documents']:
+                    yield BatchGetDocumentsResponse(found=Document(name=path, create_time=Timestamp(seconds=1),
+                                                                   update_time=Timestamp(seconds=1)),
+                                                    read_time=Timestamp(seconds=1))
+            finally:
+                self.closed = True
+        return responses()
+
+
+def client():
+    db = firestore.Client(project='test', credentials=AnonymousCredentials())
+    db._firestore_api_internal = StubFirestoreApi()
+    return metrics.instrument_firestore(db)
+
+
+def tracked(callback):
+    calls = []
+    metrics.add_firestore_observer(lambda method, started, seconds, reads, writes: calls.append((method, reads)))
+    token = metrics.track('test')
+    try:
+        callback()
+        return metrics.current_stats(), calls
+    finally:
+        metrics.reset_tracking(token)
+        metrics._observers.pop()
+
+
+def test_document_get_is_recorded_without_draining_the_stream():
+    db = client()
+    stats, calls = tracked(lambda: db.collection('products').document('p1').get())
+
+    assert (stats.reads, stats.round_trips) == (1, 1)
+    assert calls == [('batch_get_documents', 1)]
+
+
+def test_get_all_is_recorded_once():
+    db = client()
+    refs = [db.collection('products').document(f'p{i}') for i in range(3)]
+    stats, calls = tracked(lambda: list(db.get_all(refs)))
+
+    assert (stats.reads, stats.round_trips) == (3, 1)
+    assert calls == [('batch_get_documents', 3)]
+
+
+def test_abandoned_stream_is_recorded_on_close():
+    db = client()
+    refs = [db.collection('products').document(f'p{i}') for i in range(3)]
+
+    def read_one():
+        responses = db._firestore_api.batch_get_documents(
+            request={'database': db._database_string, 'documents': [r._document_path for r in refs]})
+        next(responses)
+        responses.close()
+    stats, calls = tracked(read_one)
+
+    assert (stats.reads, stats.round_trips) == (1, 1)
+    assert calls == [('batch_get_documents', 1)]
+    assert db._firestore_api.closed
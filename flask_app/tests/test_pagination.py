@@ -0,0 +1,12 @@
+import pytest
+from provider.pagination import CursorMismatchError, check_cursor, encode_cursor
+
+
+def test_cursor_from_a_listing_with_other_sort_values_is_rejected():
+    check_cursor(None, 1)
+    check_cursor('not a cursor', 1)
+    check_cursor(encode_cursor([19.5], 'p1'), 1)
+    with pytest.raises(CursorMismatchError):
+        check_cursor(encode_cursor([], 'p1'), 1)
+    with pytest.raises(CursorMismatchError):
+        check_cursor(encode_cursor([19.5], 'p1'), 0)
@@ -0,0 +1,60 @@
+import pytest
+from controllers.customer_order_controller import EmptyOrderError, OutOfStockError, place_order
+
+
+def seed(db, stock=5, quantity=2):
+    db.load({
+        'products': {
+            'p1': {'productName': 'Boots', 'productPrice': 40.0, 'quantity': stock, 'vendorId': 'v1'},
+            'p2': {'productName': 'Cap', 'productPrice': 10.0, 'quantity': 10, 'vendorId': 'v2'},
+        },
+        'users/b1/cart': {
+            'p1': {'productId': 'p1', 'quantity': quantity, 'size': '42'},
+            'p2': {'productId': 'p2', 'quantity': 1},
+        },
+    })
+
+
+def order(db):
+    return place_order(db, 'b1', 'Buyer One', '555-0100', '1 Main St', 'Cash on Delivery')
+
+
+def test_place_order_decrements_stock_and_clears_cart(db):
+    seed(db)
+    order_id = order(db)
+
+    data = db.collection('orders').document(order_id).get().to_dict()
+    assert data['totalAmount'] == 90.0
+    assert data['status'] == 'pending'
+    assert data['vendorIds'] == ['v1', 'v2']
+    assert db.collection('products').document('p1').get().get('quantity') == 3
+    assert db.collection('products').document('p2').get().get('quantity') == 9
+    assert list(db.collection('users').document('b1').collection('cart').stream()) == []
+
+
+def test_place_order_credits_each_vendor_for_its_lines(db):
+    seed(db)
+    order(db)
+
+    v1 = db.collection('vendorStats').document('v1').get().to_dict()
+    v2 = db.collection('vendorStats').document('v2').get().to_dict()
+    assert (v1['totalSales'], v1['totalOrders'], v1['pendingOrders']) == (80.0, 1, 1)
+    assert (v2['totalSales'], v2['totalOrders'], v2['pendingOrders']) == (10.0, 1, 1)
+
+
+def test_out_of_stock_writes_nothing(db):
+    seed(db, stock=1, quantity=2)
+    with pytest.raises(OutOfStockError) as error:
+        order(db)
+
+    assert error.value.product_names == ['Boots']
+    assert list(db.collection('orders').stream()) == []
+    assert list(db.collection('vendorStats').stream()) == []
+    assert db.collection('products').document('p1').get().get('quantity') == 1
+    assert len(list(db.collection('users').document('b1').collection('cart').stream())) == 2
+
+
+def test_empty_cart_is_rejected(db):
+    with pytest.raises(EmptyOrderError):
+        order(db)
+    assert list(db.collection('orders').stream()) == []
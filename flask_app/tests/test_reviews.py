@@ -0,0 +1,54 @@
+import pytest
+from controllers.review_controller import (InvalidReviewError, ProductNotFoundError,
+                                           rebuild_review_stats, submit_review)
+
+
+def product(db):
+    return db.collection('products').document('p1').get().to_dict()
+
+
+def test_first_review_seeds_aggregates_from_existing_reviews(db):
+    # Reviews written before the aggregates existed are counted once
+    db.load({
+        'products': {'p1': {'productName': 'Boots'}},
+        'products/p1/reviews': {
+            'u1': {'userId': 'u1', 'rating': 5},
+            'u2': {'userId': 'u2', 'rating': 3},
+        },
+    })
+    submit_review(db, 'p1', 'u3', 4, 'Fine')
+
+    data = product(db)
+    assert data['reviewCount'] == 3
+    assert data['ratingSum'] == 12
+    assert data['rating'] == 4.0
+    assert data['ratingHistogram'] == {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1}
+
+
+def test_replacing_a_review_backs_out_the_old_rating(db):
+    db.load({'products': {'p1': {'productName': 'Boots'}}})
+    submit_review(db, 'p1', 'u1', 5, 'Great')
+    submit_review(db, 'p1', 'u2', 3, 'Fine')
+    submit_review(db, 'p1', 'u1', 1, 'Fell apart')
+
+    data = product(db)
+    assert data['reviewCount'] == 2
+    assert data['ratingSum'] == 4
+    assert data['rating'] == 2.0
+    assert data['ratingHistogram'] == {'1': 1, '2': 0, '3': 1, '4': 0, '5': 0}
+    review = db.collection('products').document('p1').collection('reviews').document('u1').get().to_dict()
+    assert (review['rating'], review['comment']) == (1, 'Fell apart')
+    assert rebuild_review_stats(db, 'p1')['ratingSum'] == 4
+
+
+def test_invalid_rating_is_rejected(db):
+    db.load({'products': {'p1': {'productName': 'Boots'}}})
+    with pytest.raises(InvalidReviewError):
+        submit_review(db, 'p1', 'u1', 6, '')
+    assert 'reviewCount' not in product(db)
+
+
+def test_review_of_missing_product_is_rejected(db):
+    with pytest.raises(ProductNotFoundError):
+        submit_review(db, 'missing', 'u1', 4, '')
+    assert list(db.collection('products').document('missing').collection('reviews').stream()) == []
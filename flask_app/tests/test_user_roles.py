@@ -0,0 +1,58 @@
+from provider import user_roles
+from provider.datastore import create_auth
+from provider.user_roles import (cached_identity, remember_identity, resolve_user, revoke_sessions,
+                                 session_issued_at, set_user_role)
+
+
+def sign_in(db, uid='u1', **account):
+    create_auth()._users.pop(uid, None)
+    create_auth().create_user(uid=uid, email=f'{uid}@example.com', **account)
+    set_user_role(db, uid, 'buyer', f'{uid}@example.com')
+    session = {}
+    remember_identity(session, uid, *resolve_user(db, uid))
+    return session
+
+
+def load(db, session, uid='u1'):
+    # What the user loader does
+    identity = cached_identity(session, uid)
+    if identity is None:
+        identity = resolve_user(db, uid, session_issued_at(session, uid))
+        if identity is not None:
+            remember_identity(session, uid, *identity)
+    return identity
+
+
+def test_revoked_session_is_refused_by_every_worker(db):
+    session = sign_in(db)
+    assert load(db, session) == ('buyer', 'u1@example.com')
+
+    revoke_sessions(db, 'u1')
+    user_roles._identity_cache.clear()   # another worker, or this one a minute later
+    assert load(db, session) is None
+
+
+def test_revocation_in_another_worker_is_seen_after_the_check_interval(db):
+    session = sign_in(db)
+    db.collection('userRoles').document('u1').set({'revokedAt': user_roles.firestore.SERVER_TIMESTAMP}, merge=True)
+    assert load(db, session) == ('buyer', 'u1@example.com')   # still within the interval
+
+    user_roles._identity_cache.clear()
+    assert load(db, session) is None
+
+
+def test_newer_session_does_not_keep_a_revoked_one_alive(db):
+    old = sign_in(db)
+    revoke_sessions(db, 'u1')
+    new = {}
+    remember_identity(new, 'u1', *resolve_user(db, 'u1'))
+
+    assert load(db, new) == ('buyer', 'u1@example.com')
+    assert load(db, old) is None
+
+
+def test_disabled_account_is_refused_on_a_cache_miss(db):
+    session = sign_in(db)
+    create_auth().update_user('u1', disabled=True)
+    user_roles._identity_cache.clear()
+    assert load(db, session) is None
@@ -0,0 +1,46 @@
+import datetime
+
+from controllers import vendor_order_controller
+from controllers.vendor_order_controller import get_vendor_stats, rebuild_vendor_stats, recent_orders
+from provider import tasks
+
+NOW = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def seed(db):
+    db.load({'orders': {
+        'o1': {'vendorId': 'v1', 'status': 'pending', 'totalAmount': 40.0, 'createdAt': NOW,
+               'products': [{'vendorId': 'v1', 'price': 40.0, 'quantity': 1}]},
+        'o2': {'vendorId': 'v2', 'vendorIds': ['v1', 'v2'], 'status': 'delivered', 'totalAmount': 50.0,
+               'createdAt': NOW + datetime.timedelta(minutes=1),
+               'products': [{'vendorId': 'v2', 'price': 20.0, 'quantity': 1},
+                            {'vendorId': 'v1', 'price': 15.0, 'quantity': 2}]},
+    }})
+
+
+def test_recent_orders_include_orders_with_only_some_of_the_vendors_lines(db):
+    seed(db)
+    assert [doc.id for doc in recent_orders(db, 'v1')] == ['o2', 'o1']
+    assert [doc.id for doc in recent_orders(db, 'v1', limit=1)] == ['o2']
+
+
+def test_stale_rollup_is_rebuilt_from_the_orders(db, monkeypatch):
+    seed(db)
+    rebuild_vendor_stats(db, 'v1')
+    assert get_vendor_stats(db, 'v1')['totalSales'] == 70.0
+
+    # An order written without touching the rollup, as the Flutter app does
+    db.collection('orders').document('o3').set({'vendorId': 'v1', 'status': 'pending', 'totalAmount': 5.0,
+                                                'products': [{'vendorId': 'v1', 'price': 5.0, 'quantity': 1}]})
+    enqueued = []
+    monkeypatch.setattr(tasks, 'enqueue', lambda db, name, *args: enqueued.append((name, args)))
+    assert get_vendor_stats(db, 'v1')['totalSales'] == 70.0
+    assert enqueued == []
+
+    monkeypatch.setattr(vendor_order_controller, 'STATS_MAX_AGE', -1)
+    get_vendor_stats(db, 'v1')
+    get_vendor_stats(db, 'v1')
+    assert enqueued == [('vendor_stats.rebuild', ('v1',))]
+    rebuild_vendor_stats(db, 'v1')
+    stats = db.collection('vendorStats').document('v1').get().to_dict()
+    assert (stats['totalSales'], stats['totalOrders'], stats['pendingOrders']) == (75.0, 3, 2)
@@ -19,10 +19,29 @@ class ProductsScreen extends StatelessWidget {
 
   Future<void> _deleteProduct(String productId) async {
     try {
-      await FirebaseFirestore.instance
-          .collection('products')
-          .doc(productId)
-          .delete();
+      final firestore = FirebaseFirestore.instance;
+      final productRef = firestore.collection('products').doc(productId);
+
+      // Delete the product and drop its category counter in one transaction,
+      // so a second delete of the same product finds nothing to decrement
+      await firestore.runTransaction((transaction) async {
+        final productDoc = await transaction.get(productRef);
+        if (!productDoc.exists) {
+          return;
+        }
+        final category = (productDoc.data() ?? {})['category'];
+        transaction.delete(productRef);
+        if (category != null) {
+          transaction.set(
+            firestore.collection('stats').doc('categoryCounts'),
+            {
+              'counts': {category: FieldValue.increment(-1)},
+              'updatedAt': FieldValue.serverTimestamp(),
+            },
+            SetOptions(merge: true),
+          );
+        }
+      });
     } catch (e) {
       print('Error deleting product: $e');
     }
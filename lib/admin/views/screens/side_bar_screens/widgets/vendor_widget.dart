@@ -447,10 +447,20 @@ class VendorWidget extends StatelessWidget {
     );
 
     if (confirm == true) {
-      await FirebaseFirestore.instance
-          .collection('vendors')
-          .doc(vendorData.id)
-          .delete();
+      // Drop the vendor's role from the web app's role directory and revoke
+      // its sessions there, in the same commit as the delete
+      final firestore = FirebaseFirestore.instance;
+      final batch = firestore.batch();
+      batch.delete(firestore.collection('vendors').doc(vendorData.id));
+      batch.set(
+        firestore.collection('userRoles').doc(vendorData.id),
+        {
+          'role': FieldValue.delete(),
+          'revokedAt': FieldValue.serverTimestamp(),
+        },
+        SetOptions(merge: true),
+      );
+      await batch.commit();
 
       ScaffoldMessenger.of(context).showSnackBar(
         SnackBar(